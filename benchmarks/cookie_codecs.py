@@ -0,0 +1,66 @@
+"""
+Compares the cookie payload size and the encode/decode time of the cookie
+codecs. The size is measured as the `Set-Cookie` header, including the
+quoting the JSON payload needs.
+
+Run it from the repository root:
+
+    python benchmarks/cookie_codecs.py
+"""
+import os
+import sys
+import timeit
+import Cookie
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from formwizard.storage.codecs import JSONCodec, BinaryCodec
+
+
+def get_wizard_state(num_steps):
+    step_data = {}
+    for i in range(num_steps):
+        prefix = u'step%d' % i
+        step_data[prefix] = {
+            u'csrfmiddlewaretoken': u'3f2a6c1e0d9b8a7f6e5d4c3b2a190817',
+            u'%s-name' % prefix: u'Pony',
+            u'%s-email' % prefix: u'pony@example.com',
+            u'%s-address' % prefix: u'123 Main St',
+            u'%s-count' % prefix: u'%d' % i,
+        }
+    return {
+        'step': u'step%d' % (num_steps - 1),
+        'step_data': step_data,
+        'step_files': {},
+        'extra_context': {},
+    }
+
+
+def header_size(payload):
+    cookie = Cookie.SimpleCookie()
+    cookie['formwizard_Wizard'] = '%s$%s' % ('0' * 40, payload)
+    return len(cookie.output())
+
+
+def main():
+    codecs = (('json', JSONCodec()), ('binary', BinaryCodec()))
+    print '%6s %8s %12s %12s %12s' % ('steps', 'codec', 'header', 'encode',
+        'decode')
+    for num_steps in (1, 3, 10):
+        data = get_wizard_state(num_steps)
+        for name, codec in codecs:
+            payload = codec.encode(data)
+            assert codec.decode(payload) == data
+            encode = min(timeit.repeat(lambda: codec.encode(data),
+                number=1000, repeat=3)) / 1000
+            decode = min(timeit.repeat(lambda: codec.decode(payload),
+                number=1000, repeat=3)) / 1000
+            print '%6d %8s %10d B %10.1fus %10.1fus' % (num_steps, name,
+                header_size(payload), encode * 1e6, decode * 1e6)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the cost of a single step POST with `SessionStorage` (using the
+database session backend) and `DBStorage`, for wizards with many completed
+steps. A request loads the storage, reads the current step, saves the data
+of that step and writes the state back. Every timed request posts different
+data, so both storages have to write. An in-memory SQLite database is
+used, so the numbers show the serialization and query overhead, not the
+network latency of a real database server.
+
+Run it from the repository root:
+
+    python benchmarks/db_storage.py
+"""
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure(
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }},
+        INSTALLED_APPS=('django.contrib.sessions', 'formwizard'),
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+    )
+
+from django.core.management import call_command
+from django.http import HttpRequest, HttpResponse
+from django.utils.importlib import import_module
+from formwizard.storage.db import DBStorage
+from formwizard.storage.session import SessionStorage
+
+
+def get_step_data(step, revision=0):
+    prefix = u'step%d' % step
+    return {
+        u'csrfmiddlewaretoken': u'3f2a6c1e0d9b8a7f6e5d4c3b2a190817',
+        u'%s-name' % prefix: u'Pony %d' % revision,
+        u'%s-email' % prefix: u'pony@example.com',
+        u'%s-address' % prefix: u'123 Main St',
+    }
+
+
+def get_request(cookies):
+    request = HttpRequest()
+    request.COOKIES.update(cookies)
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(
+        cookies.get(settings.SESSION_COOKIE_NAME, None))
+    return request
+
+
+def post_step(storage_class, cookies, step, revision=0):
+    request = get_request(cookies)
+    storage = storage_class('Wizard', request)
+    storage.get_current_step_data()
+    storage.set_step_data(u'step%d' % step, get_step_data(step, revision))
+    storage.set_current_step(u'step%d' % (step + 1))
+    response = storage.update_response(HttpResponse())
+    if request.session.modified:
+        request.session.save()
+    for name, morsel in response.cookies.items():
+        cookies[name] = morsel.value
+    cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+
+
+def main():
+    call_command('syncdb', verbosity=0, interactive=False)
+    print '%6s %16s %16s %8s' % ('steps', 'SessionStorage', 'DBStorage',
+        'ratio')
+    for num_steps in (5, 50, 500):
+        timings = []
+        for storage_class in (SessionStorage, DBStorage):
+            cookies = {}
+            for step in range(num_steps):
+                post_step(storage_class, cookies, step)
+            revisions = itertools.count(1)
+            timings.append(min(timeit.repeat(
+                lambda: post_step(storage_class, cookies, num_steps - 1,
+                    revisions.next()),
+                number=100, repeat=3)) / 100)
+        print '%6d %14.2fms %14.2fms %7.1fx' % (num_steps,
+            timings[0] * 1e3, timings[1] * 1e3, timings[0] / timings[1])
+
+if __name__ == '__main__':
+    main()
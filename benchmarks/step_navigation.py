@@ -0,0 +1,57 @@
+"""
+Compares the step navigation lookups of `StepGraph` with the previous
+`keyOrder.index` based implementation.
+
+Run it from the repository root:
+
+    python benchmarks/step_navigation.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from django.utils.datastructures import SortedDict
+from formwizard.steps import StepGraph
+
+
+def linear_lookups(form_list):
+    keys = form_list.keyOrder
+    for step in keys:
+        key = keys.index(step)
+        if key + 1 < len(keys):
+            keys[key + 1]
+        if key > 0:
+            keys[key - 1]
+
+
+def graph_lookups(graph):
+    for step in graph.steps:
+        graph.index(step)
+        graph.next(step)
+        graph.prev(step)
+
+
+def main():
+    print '%8s %16s %16s %8s' % ('steps', 'keyOrder.index', 'StepGraph', 'ratio')
+    for num_steps in (10, 100, 1000):
+        form_list = SortedDict()
+        for i in range(num_steps):
+            form_list[u'step%d' % i] = object
+        graph = StepGraph(form_list, 0)
+
+        number = max(1, 10000 / num_steps)
+        linear = min(timeit.repeat(lambda: linear_lookups(form_list),
+            number=number, repeat=3)) / (number * num_steps)
+        constant = min(timeit.repeat(lambda: graph_lookups(graph),
+            number=number, repeat=3)) / (number * num_steps)
+        print '%8d %14.2fus %14.2fus %7.1fx' % (num_steps,
+            linear * 1e6, constant * 1e6, linear / constant)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+from UserDict import DictMixin
+
+class LazyValue(object):
+    """
+    Wraps a function computing a value of a `LazyContext`.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+class LazyContext(DictMixin):
+    """
+    A dictionary-like object for template contexts whose `LazyValue` values
+    are computed when they are read for the first time, so values a template
+    doesn't use are never computed. It isn't a `dict` subclass, because
+    copying a `dict` subclass with `dict(context)`, `update` or `**context`
+    reads the raw values. This way all ways of reading values see the
+    computed values.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.data = dict(*args, **kwargs)
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        if isinstance(value, LazyValue):
+            value = value.func()
+            self.data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def keys(self):
+        return self.data.keys()
+
+    def copy(self):
+        return LazyContext(self.data)
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -1,26 +1,59 @@
-from django.utils.datastructures import SortedDict
-from django.shortcuts import render_to_response
-from django.template import RequestContext
-from django.http import HttpResponseRedirect
-from django.core.urlresolvers import reverse
-from formwizard.storage import get_storage
-from formwizard.storage.base import NoFileStorageException
-
-from django import forms
-from django.forms import formsets
+from django.utils.datastructures import SortedDict, MultiValueDict
+from django.conf import settings
+from django.template import RequestContext, loader
+from django.http import HttpResponse, HttpResponseRedirect
+from django.core.urlresolvers import reverse, get_resolver, get_urlconf, \
+    get_script_prefix
+from django.utils.hashcompat import md5_constructor
+from formwizard.storage import get_storage_class
+from formwizard.storage.base import NoFileStorageException, StorageConflict
+from formwizard.steps import StepGraph, FormStep
+from formwizard.context import LazyContext, LazyValue
+
 import copy
+import os
+
+def get_data_fingerprint(data, files):
+    """
+    Returns a hash identifying the given step data and files. Files are
+    identified by name and size only, their content is not read.
+    """
+    if hasattr(data, 'lists'):
+        data_items = sorted(data.lists())
+    else:
+        data_items = sorted((data or {}).items())
+    file_items = sorted([(field, field_file.name, field_file.size)
+        for field, field_file in (files or {}).items()])
+    return md5_constructor(repr((data_items, file_items))).hexdigest()
 
 class FormWizard(object):
     """
     The basic FormWizard. This class needs a storage backend when creating
     an instance.
+
+    If `store_form_fields_only` is True, only the POST data belonging to the
+    form of a step (the keys starting with the form prefix) is stored
+    instead of the whole POST data, which keeps the stored state small.
+
+    If `multiple_instances` is True, a user can run several instances of the
+    wizard at the same time, for example in different browser tabs. Every
+    instance is identified by an id sent with the `form_instance` field of
+    the wizard template. At most `max_instances` instances are kept per
+    session, the least recently used ones are deleted. This requires the
+    session middleware.
     """
+    store_form_fields_only = False
+    multiple_instances = False
+    max_instances = 5
 
     def __init__(self, storage, form_list, initial_list={}, instance_list={},
         condition_list={}):
         """
         Creates a form wizard instance. `storage` is the storage backend, the
-        place where step data and current state of the form gets saved.
+        place where step data and current state of the form gets saved. It
+        can be given as dotted path or as the storage class. The class is
+        resolved here, a wrong path raises an `ImproperlyConfigured` error
+        when the wizard is created.
 
         `form_list` is a list of forms. The list entries can be form classes
         of tuples of (`step_name`, `form_class`).
@@ -34,6 +67,7 @@ class FormWizard(object):
         """
         self.form_list = SortedDict()
         self.storage_name = storage
+        self.storage_class = get_storage_class(storage)
 
         assert len(form_list) > 0, 'at least one form is needed'
 
@@ -44,11 +78,11 @@ class FormWizard(object):
             else:
                 self.form_list[unicode(i)] = form
 
-        for form in self.form_list.values():
-            if issubclass(form, formsets.BaseFormSet):
-                form = form.form
-            if [True for f in form.base_fields.values()
-                if issubclass(f.__class__, forms.FileField)] and \
+        self.template_cache = {}
+        self.form_steps = {}
+        for step, form in self.form_list.items():
+            self.form_steps[step] = FormStep(step, form)
+            if self.form_steps[step].has_file_fields and \
                 not hasattr(self, 'file_storage'):
                 raise NoFileStorageException
 
@@ -56,7 +90,31 @@ class FormWizard(object):
         self.instance_list = instance_list
         self.condition_list = condition_list
 
+    def get_form_step(self, step):
+        """
+        Returns the `FormStep` for `step`. It is rebuilt if the form class of
+        the step was replaced after the wizard was created.
+        """
+        form_step = self.form_steps.get(step, None)
+        if form_step is None or \
+            form_step.form_class is not self.form_list[step]:
+            form_step = FormStep(step, self.form_list[step])
+            self.form_steps[step] = form_step
+        return form_step
+
     def get_form_list(self, request, storage):
+        """
+        Returns a `SortedDict` of the steps whose conditions passed for the
+        current request.
+        """
+        return self.get_step_graph(request, storage).form_list
+
+    def resolve_form_list(self, request, storage):
+        """
+        Evaluates the `condition_list` and returns a new `SortedDict` with the
+        steps to use. Don't call this directly, use `get_form_list` which
+        caches the result.
+        """
         form_list = SortedDict()
         for form_key, form_class in self.form_list.items():
             condition = self.condition_list.get(form_key, True)
@@ -66,6 +124,20 @@ class FormWizard(object):
                 form_list[form_key] = form_class
         return form_list
 
+    def get_step_graph(self, request, storage):
+        """
+        Returns the `StepGraph` for the current request. The conditions are
+        evaluated once per request and again only after the stored data
+        changed, as conditions usually depend on data of previous steps.
+        """
+        graph = storage.request_cache.get('step_graph', None)
+        if graph is None or graph.revision != storage.data_revision:
+            revision = storage.data_revision
+            graph = StepGraph(self.resolve_form_list(request, storage),
+                revision)
+            storage.request_cache['step_graph'] = graph
+        return graph
+
     def __repr__(self):
         return '%s: form_list: %s, initial_list: %s' % (
             self.get_wizard_name(), self.form_list, self.initial_list)
@@ -77,19 +149,99 @@ class FormWizard(object):
         stored in `request` for later use.
 
         After processing the request using the `process_request` method, the
-        response gets updated by the storage engine (for example add cookies).
-        """
-
-        storage = get_storage(self.storage_name,
-            self.get_wizard_name(), request, getattr(self, 'file_storage', None))
-        response = self.process_request(request, storage, *args, **kwargs)
+        response gets updated by the storage engine (for example add cookies)
+        and stored files opened during the request get closed. If the storage
+        reports that another request changed the state in the meantime,
+        `storage_conflict` creates the response.
+        """
+
+        storage = self.get_storage(request)
+        try:
+            response = self.process_request(request, storage, *args, **kwargs)
+        except StorageConflict:
+            storage.close_files()
+            storage = self.get_storage(request)
+            response = self.storage_conflict(request, storage, *args,
+                **kwargs)
+        for evicted_storage in storage.request_cache.get(
+            'evicted_storages', []):
+            evicted_storage.update_response(response)
+            evicted_storage.close_files()
         storage.update_response(response)
+        storage.close_files()
 
         if kwargs.get('testmode', False):
             return response, storage
         else:
             return response
 
+    def get_storage(self, request):
+        """
+        Returns the storage for the current request. If `multiple_instances`
+        is set, every wizard instance gets a storage of its own, named after
+        the wizard and the instance id.
+        """
+        wizard_name = self.get_wizard_name()
+        file_storage = getattr(self, 'file_storage', None)
+        if not self.multiple_instances:
+            return self.storage_class(wizard_name, request, file_storage)
+
+        instance_id, evicted = self.get_wizard_instance(request)
+        storage = self.storage_class('%s_%s' % (wizard_name, instance_id),
+            request, file_storage)
+        storage.request_cache['wizard_instance'] = instance_id
+        storage.request_cache['evicted_storages'] = []
+        for evicted_id in evicted:
+            evicted_storage = self.storage_class(
+                '%s_%s' % (wizard_name, evicted_id), request, file_storage)
+            evicted_storage.delete()
+            storage.request_cache['evicted_storages'].append(evicted_storage)
+        return storage
+
+    def get_wizard_instance(self, request):
+        """
+        Returns the id of the wizard instance of the current request and a
+        list of ids of instances to delete. The id is taken from the
+        `form_instance` POST or GET parameter, a new instance is started if
+        there is none or it is unknown.
+
+        The ids of the instances of a user are kept in the session, most
+        recently used first. Starting an instance beyond `max_instances`
+        evicts the least recently used ones.
+        """
+        key = 'formwizard_%s_instances' % self.get_wizard_name()
+        instances = request.session.get(key, [])
+        instance_id = request.POST.get('form_instance',
+            request.GET.get('form_instance', None))
+        evicted = []
+        if instance_id not in instances:
+            instance_id = os.urandom(8).encode('hex')
+            instances = [instance_id] + instances
+            evicted = instances[self.max_instances:]
+            instances = instances[:self.max_instances]
+        elif instances[0] != instance_id:
+            instances = [instance_id] + [i for i in instances
+                if i != instance_id]
+        else:
+            return instance_id, evicted
+        request.session[key] = instances
+        return instance_id, evicted
+
+    def storage_conflict(self, request, storage, *args, **kwargs):
+        """
+        Gets called if the wizard state was changed by another request, for
+        example in another browser tab, while this request was processed.
+        Storages raise the conflict before they write anything, `storage`
+        contains the state written by the other request.
+
+        By default, the request is processed again using the new state. If
+        the state changes again, a response with status 409 is returned.
+        """
+        try:
+            return self.process_request(request, storage, *args, **kwargs)
+        except StorageConflict:
+            return HttpResponse(status=409)
+
     def process_request(self, request, *args, **kwargs):
         """
         Returns a response generated by either `process_get_request` or
@@ -138,21 +290,37 @@ class FormWizard(object):
             )
         else:
             # Check if form was refreshed
-            current_step = self.determine_step(request, storage)
-            prev_step = self.get_prev_step(request, storage, step=current_step)
-            for value in request.POST:
-                if prev_step and not value.startswith(current_step) and value.startswith(prev_step):
-                    # form refreshed, change current step
-                    storage.set_current_step(prev_step)
-                    break
+            submitted_step = request.POST.get('form_current_step', None)
+            if submitted_step is not None:
+                # only steps which were reached already can be submitted
+                graph = self.get_step_graph(request, storage)
+                current_step = self.determine_step(request, storage)
+                if submitted_step in graph and current_step in graph and \
+                    graph.index(submitted_step) <= graph.index(current_step):
+                    storage.set_current_step(submitted_step)
+            else:
+                # templates without the step marker, guess the step using
+                # the prefixes of the posted fields
+                current_step = self.determine_step(request, storage)
+                prev_step = self.get_prev_step(request, storage, step=current_step)
+                for value in request.POST:
+                    if prev_step and not value.startswith(current_step) and value.startswith(prev_step):
+                        # form refreshed, change current step
+                        storage.set_current_step(prev_step)
+                        break
 
             form = self.get_form(request, storage, data=request.POST,
                 files=request.FILES)
             if form.is_valid():
+                step_data = self.process_step(request, storage, form)
                 storage.set_step_data(self.determine_step(request, storage),
-                    self.process_step(request, storage, form))
-                storage.set_step_files(self.determine_step(request, storage),
-                    self.process_step_files(request, storage, form))
+                    step_data)
+                if form.files:
+                    storage.set_step_files(
+                        self.determine_step(request, storage),
+                        self.process_step_files(request, storage, form))
+                self.cache_validated_form(request, storage,
+                    self.determine_step(request, storage), form, step_data)
 
                 current_step = self.determine_step(request, storage)
                 last_step = self.get_last_step(request, storage)
@@ -182,12 +350,16 @@ class FormWizard(object):
         all steps to prevent manipulation. If any form don't validate,
         `render_revalidation_failure` should get called. If everything is fine
         call `done`.
+
+        The state is claimed before, so `done` never runs for a state which
+        another request changed and a conflicting request isn't processed
+        again after `done` was called.
         """
+        storage.claim()
         final_form_list = []
-        for form_key in self.get_form_list(request, storage).keys():
-            form_obj = self.get_form(request, storage, step=form_key,
-                data=storage.get_step_data(form_key),
-                files=storage.get_step_files(form_key))
+        form_keys = self.get_form_list(request, storage).keys()
+        form_objs = self.get_validated_forms(request, storage, form_keys)
+        for form_key, form_obj in zip(form_keys, form_objs):
             if not form_obj.is_valid():
                 return self.render_revalidation_failure(request, storage,
                     form_key, form_obj, **kwargs)
@@ -207,6 +379,8 @@ class FormWizard(object):
         """
         if step is None:
             step = self.determine_step(request, storage)
+        if step in self.form_list:
+            return self.get_form_step(step).prefix
         return str(step)
 
     def get_form_initial(self, request, storage, step):
@@ -235,20 +409,18 @@ class FormWizard(object):
         """
         if step is None:
             step = self.determine_step(request, storage)
+        form_step = self.get_form_step(step)
         kwargs = {
             'data': data,
             'files': files,
             'prefix': self.get_form_prefix(request, storage, step,
-                self.form_list[step]),
+                form_step.form_class),
             'initial': self.get_form_initial(request, storage, step),
         }
-        if issubclass(self.form_list[step], forms.ModelForm):
-            kwargs.update({'instance':
-                self.get_form_instance(request, storage, step)})
-        elif issubclass(self.form_list[step], forms.models.BaseModelFormSet):
-            kwargs.update({'queryset':
-                self.get_form_instance(request, storage, step)})
-        return self.form_list[step](**kwargs)
+        if form_step.instance_kwarg:
+            kwargs[form_step.instance_kwarg] = self.get_form_instance(
+                request, storage, step)
+        return form_step.form_class(**kwargs)
 
     def process_step(self, request, storage, form):
         """
@@ -274,8 +446,21 @@ class FormWizard(object):
         """
         Is used to return the raw form data. You may use this method to
         manipulate the data.
-        """
-        return form.data
+
+        If `store_form_fields_only` is set, a `MultiValueDict` with the keys
+        of the form's prefix is returned instead.
+        """
+        if not self.store_form_fields_only or not form.prefix:
+            return form.data
+        prefix = '%s-' % form.prefix
+        data = MultiValueDict()
+        for key in form.data.keys():
+            if key.startswith(prefix):
+                if hasattr(form.data, 'getlist'):
+                    data.setlist(key, form.data.getlist(key))
+                else:
+                    data[key] = form.data[key]
+        return data
 
     def get_form_step_files(self, request, storage, form):
         """
@@ -291,10 +476,9 @@ class FormWizard(object):
         and contain a list of the formset' cleaned_data dictionaries.
         """
         cleaned_dict = {}
-        for form_key in self.get_form_list(request, storage).keys():
-            form_obj = self.get_form(request, storage, step=form_key,
-                data=storage.get_step_data(form_key),
-                files=storage.get_step_files(form_key))
+        form_keys = self.get_form_list(request, storage).keys()
+        form_objs = self.get_validated_forms(request, storage, form_keys)
+        for form_key, form_obj in zip(form_keys, form_objs):
             if form_obj.is_valid():
                 if isinstance(form_obj.cleaned_data, list):
                     cleaned_dict.update({
@@ -311,13 +495,61 @@ class FormWizard(object):
         form. If the data doesn't validate, None will be returned.
         """
         if self.form_list.has_key(step):
-            form_obj = self.get_form(request, storage, step=step,
-                data=storage.get_step_data(step),
-                files=storage.get_step_files(step))
+            form_obj = self.get_validated_form(request, storage, step)
             if form_obj.is_valid():
                 return form_obj.cleaned_data
         return None
 
+    def get_validated_form(self, request, storage, step):
+        """
+        Returns the form for `step`, bound to the stored data and files and
+        already validated. Validated forms are cached for the current request
+        using the step and a fingerprint of its data, so the final submit
+        validates every step only once even if `done` asks for the cleaned
+        data again.
+        """
+        return self.get_validated_forms(request, storage, [step])[0]
+
+    def get_validated_forms(self, request, storage, steps):
+        """
+        Returns a list of validated forms for `steps`, like
+        `get_validated_form`. The data and files of all steps are fetched
+        from the storage at once.
+        """
+        steps_data = storage.get_steps_data(steps)
+        steps_files = storage.get_steps_files(steps)
+        cache = storage.request_cache.setdefault('validated_forms', {})
+        form_objs = []
+        for step in steps:
+            data, files = steps_data[step], steps_files.get(step, None)
+            key = (step, get_data_fingerprint(data, files))
+            if key not in cache:
+                form_obj = self.get_form(request, storage, step=step,
+                    data=data, files=files)
+                form_obj.is_valid()
+                cache[key] = form_obj
+            form_objs.append(cache[key])
+        return form_objs
+
+    def cache_validated_form(self, request, storage, step, form, step_data):
+        """
+        Adds the submitted and validated `form` of `step` to the forms cached
+        by `get_validated_forms`, using the fingerprint of the data stored for
+        the step. This way the final submit doesn't validate the submitted
+        step a second time.
+
+        The form is only cached if `step_data`, the data returned by
+        `process_step`, is the data of the form and no files are involved.
+        Otherwise the step is validated again using the stored data and
+        files, which `done` has to get.
+        """
+        if step_data is not form.data or form.files or \
+            storage.get_step_files(step):
+            return
+        data = storage.get_step_data(step)
+        cache = storage.request_cache.setdefault('validated_forms', {})
+        cache[(step, get_data_fingerprint(data, None))] = form
+
     def determine_step(self, request, storage):
         """
         Returns the current step. If no current step is stored in the storage
@@ -330,13 +562,13 @@ class FormWizard(object):
         """
         Returns the name of the first step.
         """
-        return self.get_form_list(request, storage).keys()[0]
+        return self.get_step_graph(request, storage).first
 
     def get_last_step(self, request, storage):
         """
         Returns the name of the last step.
         """
-        return self.get_form_list(request, storage).keys()[-1]
+        return self.get_step_graph(request, storage).last
 
     def get_next_step(self, request, storage, step=None):
         """
@@ -344,15 +576,9 @@ class FormWizard(object):
         available, None will be returned. If the `step` argument is None, the
         current step will be determined automatically.
         """
-        form_list = self.get_form_list(request, storage)
-
         if step is None:
             step = self.determine_step(request, storage)
-        key = form_list.keyOrder.index(step) + 1
-        if len(form_list.keyOrder) > key:
-            return form_list.keyOrder[key]
-        else:
-            return None
+        return self.get_step_graph(request, storage).next(step)
 
     def get_prev_step(self, request, storage, step=None):
         """
@@ -360,15 +586,9 @@ class FormWizard(object):
         steps available, None will be returned. If the `step` argument is None, the
         current step will be determined automatically.
         """
-        form_list = self.get_form_list(request, storage)
-
         if step is None:
             step = self.determine_step(request, storage)
-        key = form_list.keyOrder.index(step) - 1
-        if key < 0:
-            return None
-        else:
-            return form_list.keyOrder[key]
+        return self.get_step_graph(request, storage).prev(step)
 
     def get_step_index(self, request, storage, step=None):
         """
@@ -377,13 +597,13 @@ class FormWizard(object):
         """
         if step is None:
             step = self.determine_step(request, storage)
-        return self.get_form_list(request, storage).keyOrder.index(step)
+        return self.get_step_graph(request, storage).index(step)
 
     def get_num_steps(self, request, storage):
         """
         Returns the total number of steps/forms in this the wizard.
         """
-        return len(self.get_form_list(request, storage))
+        return len(self.get_step_graph(request, storage))
 
     def get_wizard_name(self):
         """
@@ -416,19 +636,33 @@ class FormWizard(object):
             if storage.get_current_step() == 'my_step_name':
                 context.update({'another_var': True})
             return context
-        """
-        return {
-            'extra_context': self.get_extra_context(request, storage),
-            'form_step': self.determine_step(request, storage),
-            'form_first_step': self.get_first_step(request, storage),
-            'form_last_step': self.get_last_step(request, storage),
-            'form_prev_step': self.get_prev_step(request, storage),
-            'form_next_step': self.get_next_step(request, storage),
-            'form_step0': int(self.get_step_index(request, storage)),
-            'form_step1': int(self.get_step_index(request, storage)) + 1,
-            'form_step_count': self.get_num_steps(request, storage),
+
+        The returned `LazyContext` computes the values describing the steps
+        only when the template uses them.
+        """
+        step = self.determine_step(request, storage)
+        return LazyContext({
+            'extra_context': LazyValue(
+                lambda: self.get_extra_context(request, storage)),
+            'form_step': step,
+            'form_first_step': LazyValue(
+                lambda: self.get_first_step(request, storage)),
+            'form_last_step': LazyValue(
+                lambda: self.get_last_step(request, storage)),
+            'form_prev_step': LazyValue(
+                lambda: self.get_prev_step(request, storage, step)),
+            'form_next_step': LazyValue(
+                lambda: self.get_next_step(request, storage, step)),
+            'form_step0': LazyValue(
+                lambda: int(self.get_step_index(request, storage, step))),
+            'form_step1': LazyValue(
+                lambda: int(self.get_step_index(request, storage, step)) + 1),
+            'form_step_count': LazyValue(
+                lambda: self.get_num_steps(request, storage)),
+            'form_instance': storage.request_cache.get('wizard_instance',
+                None),
             'form': form,
-        }
+        })
 
     def get_extra_context(self, request, storage):
         """
@@ -470,9 +704,30 @@ class FormWizard(object):
         """
 
         form = form or self.get_form(request, storage)
-        return render_to_response(self.get_template(request, storage),
-            self.get_template_context(request, storage, form),
-            context_instance=RequestContext(request))
+        context_instance = RequestContext(request)
+        context_instance.update(
+            self.get_template_context(request, storage, form))
+        return HttpResponse(self.get_compiled_template(request, storage)
+            .render(context_instance))
+
+    def get_compiled_template(self, request, storage):
+        """
+        Returns the compiled template for the names returned by
+        `get_template`. Compiled templates are cached by the wizard, unless
+        `DEBUG` is set, so changed templates are picked up during
+        development.
+        """
+        template_name = self.get_template(request, storage)
+        if isinstance(template_name, basestring):
+            template_name = (template_name,)
+        else:
+            template_name = tuple(template_name)
+        if settings.DEBUG:
+            return loader.select_template(template_name)
+        if template_name not in self.template_cache:
+            self.template_cache[template_name] = loader.select_template(
+                template_name)
+        return self.template_cache[template_name]
 
     def done(self, request, storage, form_list, **kwargs):
         """
@@ -501,13 +756,20 @@ class CookieFormWizard(FormWizard):
 class NamedUrlFormWizard(FormWizard):
     """
     A FormWizard with url-named steps support.
+
+    By default, every step change redirects the browser to the url of the
+    new step. If `redirect_free` is True, the new step is rendered directly
+    instead and its url is sent in the `Content-Location` header, which
+    saves a request per step.
     """
     done_step_name = 'done'
+    redirect_free = False
 
     def __init__(self, *args, **kwargs):
         """
         We require a url_name to reverse urls later. Additionally users can
-        pass a done_step_name to change the url-name of the "done" view.
+        pass a done_step_name to change the url-name of the "done" view and
+        redirect_free to render steps without redirects.
         """
         assert kwargs.has_key('url_name'), \
             'url name is needed to resolve correct wizard urls'
@@ -518,11 +780,91 @@ class NamedUrlFormWizard(FormWizard):
             self.done_step_name = kwargs['done_step_name']
             del kwargs['done_step_name']
 
+        if kwargs.has_key('redirect_free'):
+            self.redirect_free = kwargs['redirect_free']
+            del kwargs['redirect_free']
+
         super(NamedUrlFormWizard, self).__init__(*args, **kwargs)
 
         assert not self.form_list.has_key(self.done_step_name), \
             'step name "%s" is reserved for "done" view' % self.done_step_name
 
+        self.step_url_cache = {}
+
+    def get_step_urls(self, request, storage):
+        """
+        Returns a dictionary with the urls of all steps and the done step.
+        The urls are reversed once per URLconf and script prefix and again
+        after the URLconf was reloaded.
+        """
+        urlconf = get_urlconf()
+        resolver = get_resolver(urlconf)
+        key = (urlconf, get_script_prefix())
+        cached = self.step_url_cache.get(key, None)
+        if cached is None or cached[0] is not resolver:
+            step_urls = {}
+            for step in self.form_list.keys() + [self.done_step_name]:
+                step_urls[step] = reverse(self.url_name, urlconf=urlconf,
+                    kwargs={'step': step})
+            cached = (resolver, step_urls)
+            self.step_url_cache[key] = cached
+        return cached[1]
+
+    def get_step_url(self, request, storage, step):
+        """
+        Returns the url of `step`, including the id of the wizard instance
+        if `multiple_instances` is set.
+        """
+        step_urls = self.get_step_urls(request, storage)
+        if step in step_urls:
+            return self.get_instance_url(request, storage, step_urls[step])
+        return self.get_instance_url(request, storage,
+            reverse(self.url_name, kwargs={'step': step}))
+
+    def get_instance_url(self, request, storage, url):
+        """
+        Adds the id of the current wizard instance to `url`.
+        """
+        instance_id = storage.request_cache.get('wizard_instance', None)
+        if instance_id is None:
+            return url
+        return '%s?form_instance=%s' % (url, instance_id)
+
+    def get_template_context(self, request, storage, form):
+        """
+        Adds `form_step_urls`, a dictionary with the urls of all steps, and
+        `form_done_url`, the url of the done step, to the template context.
+        """
+        context = super(NamedUrlFormWizard, self).get_template_context(
+            request, storage, form)
+        context['form_step_urls'] = LazyValue(lambda: dict([
+            (step, self.get_instance_url(request, storage, url))
+            for step, url in self.get_step_urls(request, storage).items()
+            if step != self.done_step_name]))
+        context['form_done_url'] = LazyValue(lambda: self.get_step_url(
+            request, storage, self.done_step_name))
+        return context
+
+    def render_step_redirect(self, request, storage, step, form=None,
+        **kwargs):
+        """
+        Sends the browser to `step`, which has to be the current step in the
+        storage. Returns a redirect to the step url or, if `redirect_free` is
+        set, the rendered step. `form` is rendered if given, otherwise the
+        form is built from the stored data.
+        """
+        step_url = self.get_step_url(request, storage, step)
+        if not self.redirect_free:
+            return HttpResponseRedirect(step_url)
+
+        if form is None:
+            form = self.get_form(request, storage, step=step,
+                data=storage.get_step_data(step),
+                files=storage.get_step_files(step))
+        response = self.render(request, storage, form, **kwargs)
+        response['Content-Location'] = step_url
+        return response
+
     def process_get_request(self, request, storage, *args, **kwargs):
         """
         This renders the form or, if needed, does the http redirects.
@@ -536,8 +878,8 @@ class NamedUrlFormWizard(FormWizard):
                 self.update_extra_context(request, storage,
                     kwargs['extra_context'])
 
-            return HttpResponseRedirect(reverse(self.url_name,
-                kwargs={'step': self.determine_step(request, storage)}))
+            return self.render_step_redirect(request, storage,
+                self.determine_step(request, storage))
         else:
             if 'extra_context' in kwargs:
                 self.update_extra_context(request, storage,
@@ -547,13 +889,11 @@ class NamedUrlFormWizard(FormWizard):
 
             # is the current step the "done" name/view?
             if step_url == self.done_step_name:
+                # the validated form is reused when render_done revalidates
+                # all steps
                 return self.render_done(request, storage,
-                    self.get_form(request, storage,
-                        step=self.get_last_step(request, storage),
-                        data=storage.get_step_data(
-                            self.get_last_step(request, storage)),
-                        files=storage.get_step_files(
-                            self.get_last_step(request, storage))), **kwargs)
+                    self.get_validated_form(request, storage,
+                        self.get_last_step(request, storage)), **kwargs)
 
             # is the url step name not equal to the step in the storage?
             # if yes, change the step in the storage (if name exists)
@@ -571,8 +911,8 @@ class NamedUrlFormWizard(FormWizard):
                     storage.set_current_step(
                         self.get_first_step(request, storage))
 
-                    return HttpResponseRedirect(reverse(self.url_name,
-                        kwargs={'step': storage.get_current_step()}))
+                    return self.render_step_redirect(request, storage,
+                        storage.get_current_step())
             else:
                 # url step name and storage step name are equal, render!
                 return self.render(request, storage,
@@ -590,9 +930,8 @@ class NamedUrlFormWizard(FormWizard):
             self.get_form_list(request, storage).has_key(request.POST['form_prev_step']):
 
             storage.set_current_step(request.POST['form_prev_step'])
-            return HttpResponseRedirect(reverse(self.url_name, kwargs={
-                'step': storage.get_current_step()
-            }))
+            return self.render_step_redirect(request, storage,
+                storage.get_current_step())
         else:
             return super(NamedUrlFormWizard, self).process_post_request(
                 request, storage, *args, **kwargs)
@@ -604,8 +943,7 @@ class NamedUrlFormWizard(FormWizard):
         """
         next_step = self.get_next_step(request, storage)
         storage.set_current_step(next_step)
-        return HttpResponseRedirect(
-            reverse(self.url_name, kwargs={'step': next_step}))
+        return self.render_step_redirect(request, storage, next_step)
 
     def render_revalidation_failure(self, request, storage, failed_step, form, **kwargs):
         """
@@ -613,20 +951,19 @@ class NamedUrlFormWizard(FormWizard):
         step.
         """
         storage.set_current_step(failed_step)
-        return HttpResponseRedirect(reverse(self.url_name, kwargs={
-            'step': storage.get_current_step()
-        }))
+        return self.render_step_redirect(request, storage,
+            storage.get_current_step(), form)
 
     def render_done(self, request, storage, form, **kwargs):
         """
         When rendering the done view, we have to redirect first (if the url
-        name doesn't fit).
+        name doesn't fit). In `redirect_free` mode, the done view is rendered
+        directly.
         """
         step_url = kwargs.get('step', None)
-        if step_url <> self.done_step_name:
-            return HttpResponseRedirect(reverse(self.url_name, kwargs={
-                'step': self.done_step_name
-            }))
+        if step_url <> self.done_step_name and not self.redirect_free:
+            return HttpResponseRedirect(self.get_step_url(request, storage,
+                self.done_step_name))
 
         return super(NamedUrlFormWizard, self).render_done(
             request, storage, form, **kwargs)
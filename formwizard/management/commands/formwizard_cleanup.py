@@ -0,0 +1,60 @@
+from optparse import make_option
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.importlib import import_module
+
+from formwizard.models import TemporaryUpload, WizardInstance, \
+    get_storage_location
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size',
+            type='int', default=100,
+            help='Number of files or wizards deleted per batch.'),
+        make_option('--max-batches', action='store', dest='max_batches',
+            type='int', default=None,
+            help='Stop after this number of batches.'),
+        make_option('--orphans', action='store', dest='orphans', default=None,
+            help='Also delete untracked files older than the upload expiry '
+                'from this directory of the file storages, which must only '
+                'contain wizard uploads. Use . for the root of a file '
+                'storage used by wizards only.'),
+    )
+    help = 'Deletes uploads of abandoned form wizards and their state ' \
+        'stored by the database storage. Can be run as a cronjob.'
+    args = '[file_storage_path ...]'
+
+    def handle(self, *storage_paths, **options):
+        if storage_paths:
+            file_storages = [self.load_file_storage(path)
+                for path in storage_paths]
+        else:
+            file_storages = [default_storage]
+
+        verbosity = int(options.get('verbosity', 1))
+        deleted = WizardInstance.objects.delete_expired(options['batch_size'],
+            options['max_batches'])
+        transaction.commit_unless_managed()
+        if verbosity > 0:
+            print 'Deleted %d expired wizards' % deleted
+
+        for file_storage in file_storages:
+            deleted = TemporaryUpload.objects.delete_expired(file_storage,
+                options['batch_size'], options['max_batches'])
+            if options['orphans']:
+                deleted += TemporaryUpload.objects.delete_orphans(file_storage,
+                    options['orphans'], options['batch_size'])
+            transaction.commit_unless_managed()
+            if verbosity > 0:
+                print 'Deleted %d files from %s' % (deleted,
+                    get_storage_location(file_storage))
+
+    def load_file_storage(self, path):
+        i = path.rfind('.')
+        module, attr = path[:i], path[i+1:]
+        try:
+            return getattr(import_module(module), attr)
+        except (ImportError, AttributeError), e:
+            raise CommandError('Error loading file storage %s: "%s"' % (path, e))
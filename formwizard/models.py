@@ -0,0 +1,332 @@
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import models
+from django.db.models import F
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import sha_constructor
+from datetime import datetime, timedelta
+import base64
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+def get_upload_chunk_size():
+    return getattr(settings, 'FORMWIZARD_UPLOAD_CHUNK_SIZE', 64 * 2**10)
+
+def get_upload_expiry():
+    """
+    Returns the time after which an upload is considered abandoned, by
+    default the session cookie age.
+    """
+    return timedelta(seconds=getattr(settings, 'FORMWIZARD_UPLOAD_EXPIRY',
+        settings.SESSION_COOKIE_AGE))
+
+def get_wizard_expiry():
+    """
+    Returns the time after which the state of an unused wizard stored in the
+    database is deleted, by default the session cookie age.
+    """
+    return timedelta(seconds=getattr(settings, 'FORMWIZARD_STORAGE_EXPIRY',
+        settings.SESSION_COOKIE_AGE))
+
+def encode_value(value):
+    return base64.b64encode(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+def decode_value(data):
+    return pickle.loads(base64.b64decode(data))
+
+def get_storage_location(file_storage):
+    """
+    Returns a string identifying a file storage, used to keep the uploads
+    of different file storages apart.
+    """
+    storage_class = file_storage.__class__
+    return ('%s.%s:%s' % (storage_class.__module__, storage_class.__name__,
+        getattr(file_storage, 'location', '')))[:255]
+
+def get_file_checksum(uploaded_file):
+    """
+    Returns the sha1 hex digest and the size of the file content.
+    """
+    checksum = sha_constructor()
+    size = 0
+    for chunk in uploaded_file.chunks(get_upload_chunk_size()):
+        checksum.update(chunk)
+        size += len(chunk)
+    return checksum.hexdigest(), size
+
+class ChecksumFile(File):
+    """
+    Wraps a file and computes the checksum and size of its content while
+    the file storage reads it, using `chunks` in chunks of
+    `FORMWIZARD_UPLOAD_CHUNK_SIZE` bytes or `read`. `get_checksum` returns
+    None unless the whole content was read in order.
+    """
+    def __init__(self, file):
+        super(ChecksumFile, self).__init__(file, file.name)
+        self.reset_checksum()
+
+    def reset_checksum(self):
+        self.checksum = sha_constructor()
+        self.bytes_read = 0
+
+    def get_checksum(self):
+        if self.checksum is None or self.bytes_read != self.file.size:
+            return None
+        return self.checksum.hexdigest()
+
+    def read(self, *args):
+        data = self.file.read(*args)
+        if self.checksum is not None:
+            self.checksum.update(data)
+            self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        self.file.seek(offset, whence)
+        if offset == 0 and whence == 0:
+            self.reset_checksum()
+        else:
+            # the content isn't read in order anymore
+            self.checksum = None
+
+    def chunks(self, chunk_size=None):
+        if hasattr(self.file, 'seek'):
+            self.seek(0)
+        while True:
+            chunk = self.read(get_upload_chunk_size())
+            if not chunk:
+                break
+            yield chunk
+
+class TemporaryUploadManager(models.Manager):
+    def store(self, file_storage, uploaded_file):
+        """
+        Saves `uploaded_file` to `file_storage` unless a file with the same
+        content is stored already and returns the `TemporaryUpload`. Every
+        call adds a reference which has to be given back using `release`.
+
+        Uploads kept in memory and temporary uploads which a
+        `FileSystemStorage` can move by renaming are checked for a stored
+        copy before anything is written. All other files are copied only
+        once, the checksum is computed while the file storage reads them.
+        If the file storage didn't read the whole file in order, the checksum
+        is unknown and the file isn't shared with other uploads.
+        """
+        location = get_storage_location(file_storage)
+        if isinstance(uploaded_file, InMemoryUploadedFile) or (
+            hasattr(uploaded_file, 'temporary_file_path') and
+            isinstance(file_storage, FileSystemStorage)):
+            checksum, size = get_file_checksum(uploaded_file)
+            upload = self._add_reference(location, checksum)
+            if upload is None:
+                uploaded_file.seek(0)
+                tmp_name = file_storage.save(uploaded_file.name, uploaded_file)
+                upload = self._register(file_storage, location, checksum,
+                    size, tmp_name)
+        else:
+            content = ChecksumFile(uploaded_file)
+            tmp_name = file_storage.save(uploaded_file.name, content)
+            checksum = content.get_checksum()
+            if checksum is None:
+                # not a sha1 hex digest, so it never matches another upload
+                checksum = 'unchecked:%s' % sha_constructor(
+                    smart_str(tmp_name)).hexdigest()[:30]
+            upload = self._register(file_storage, location, checksum,
+                uploaded_file.size, tmp_name)
+        return upload
+
+    def _add_reference(self, location, checksum):
+        """
+        Adds a reference to the stored upload with `checksum` and returns it,
+        or None if there is none. The reference is added before the upload
+        is fetched, so a concurrent `release` can't delete it in between.
+        """
+        uploads = self.filter(location=location, checksum=checksum)
+        if not uploads.update(references=F('references') + 1,
+            expires=datetime.now() + get_upload_expiry()):
+            return None
+        try:
+            return uploads.get()
+        except self.model.DoesNotExist:
+            return None
+
+    def _register(self, file_storage, location, checksum, size, tmp_name):
+        """
+        Tracks the saved file `tmp_name` with a first reference, or deletes it
+        and adds a reference to the upload with the same content if another
+        request stored one in the meantime.
+        """
+        while True:
+            upload, created = self.get_or_create(location=location,
+                checksum=checksum, defaults={'tmp_name': tmp_name,
+                    'size': size, 'references': 1,
+                    'expires': datetime.now() + get_upload_expiry()})
+            if created:
+                return upload
+            upload = self._add_reference(location, checksum)
+            if upload is not None:
+                # the same content was stored already
+                file_storage.delete(tmp_name)
+                return upload
+
+    def release(self, file_storage, tmp_name, keep=False):
+        """
+        Gives back a reference to the stored file `tmp_name`. The file is
+        deleted when no wizard step references it anymore. If `keep` is
+        True, an unreferenced file expires instead and is deleted by the next
+        run of the `formwizard_cleanup` command, storing the same content
+        again before uses the file again.
+        """
+        uploads = self.filter(location=get_storage_location(file_storage),
+            tmp_name=tmp_name)
+        if not uploads.update(references=F('references') - 1):
+            # the file was stored before uploads were tracked
+            if not keep:
+                file_storage.delete(tmp_name)
+            return
+        if keep:
+            uploads.filter(references__lte=0).update(expires=datetime.now())
+            return
+        for upload in uploads.filter(references__lte=0):
+            # only delete the file if no reference was added in the meantime
+            self.filter(pk=upload.pk, references__lte=0).delete()
+            if not self.filter(pk=upload.pk).exists():
+                file_storage.delete(upload.tmp_name)
+
+    def delete_expired(self, file_storage, batch_size=100, max_batches=None):
+        """
+        Deletes uploads of `file_storage` whose wizards were abandoned, oldest
+        first, `batch_size` uploads at a time. Stops after `max_batches`
+        batches if given. Returns the number of deleted files.
+        """
+        expired = self.filter(location=get_storage_location(file_storage),
+            expires__lt=datetime.now()).order_by('expires')
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = list(expired[:batch_size])
+            if not batch:
+                break
+            for upload in batch:
+                file_storage.delete(upload.tmp_name)
+            self.filter(pk__in=[upload.pk for upload in batch]).delete()
+            deleted += len(batch)
+            batches += 1
+        return deleted
+
+    def delete_orphans(self, file_storage, path, batch_size=100):
+        """
+        Scans the directory `path` of `file_storage` for files which are not
+        tracked and older than the upload expiry, for example files left over
+        from before uploads were tracked, and deletes them. `path` must only
+        contain wizard uploads, pass '.' for the root of a file storage used
+        by wizards only. This requires a file storage which implements
+        `path`. Returns the number of deleted files.
+        """
+        path = os.path.normpath(path)
+        if path == '.':
+            path = ''
+        location = get_storage_location(file_storage)
+        oldest = datetime.now() - get_upload_expiry()
+        deleted = 0
+        directories, files = file_storage.listdir(path)
+        for i in range(0, len(files), batch_size):
+            names = [os.path.join(path, name) for name in files[i:i + batch_size]]
+            tracked = set(self.filter(location=location,
+                tmp_name__in=names).values_list('tmp_name', flat=True))
+            for name in names:
+                modified = datetime.fromtimestamp(
+                    os.path.getmtime(file_storage.path(name)))
+                if name not in tracked and modified < oldest:
+                    file_storage.delete(name)
+                    deleted += 1
+        for directory in directories:
+            deleted += self.delete_orphans(file_storage,
+                os.path.join(path, directory), batch_size)
+        return deleted
+
+class TemporaryUpload(models.Model):
+    """
+    A file saved in the file storage of a wizard. Files are addressed by the
+    checksum of their content, so identical uploads are stored only once.
+    `references` counts the wizard steps using the file, uploads of
+    abandoned wizards are deleted by the `formwizard_cleanup` command after
+    `expires`.
+    """
+    location = models.CharField(max_length=255)
+    checksum = models.CharField(max_length=40)
+    tmp_name = models.CharField(max_length=255)
+    size = models.IntegerField(default=0)
+    references = models.IntegerField(default=0)
+    expires = models.DateTimeField(db_index=True)
+
+    objects = TemporaryUploadManager()
+
+    class Meta:
+        unique_together = (('location', 'checksum'),)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.tmp_name, self.checksum)
+
+class WizardInstanceManager(models.Manager):
+    def delete_expired(self, batch_size=100, max_batches=None):
+        """
+        Deletes the state of wizards which weren't used since they expired,
+        `batch_size` wizards at a time, with one query for their steps and
+        one for the wizards per batch. Stops after `max_batches` batches if
+        given. Returns the number of deleted wizards.
+
+        Files of the deleted steps aren't touched, they expire on their own,
+        see `TemporaryUploadManager.delete_expired`.
+        """
+        expired = self.filter(expires__lt=datetime.now()).order_by('expires')
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            pks = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            WizardStep.objects.filter(instance__in=pks).delete()
+            self.filter(pk__in=pks).delete()
+            deleted += len(pks)
+            batches += 1
+        return deleted
+
+class WizardInstance(models.Model):
+    """
+    The state of a wizard stored by `formwizard.storage.db.DBStorage`,
+    identified by a random key kept in a cookie. The data of the steps is
+    stored in one `WizardStep` per step. `version` is increased by every
+    request changing the state.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    current_step = models.CharField(max_length=255, null=True)
+    extra_context = models.TextField(default='')
+    version = models.IntegerField(default=0)
+    expires = models.DateTimeField(db_index=True)
+
+    objects = WizardInstanceManager()
+
+    def __unicode__(self):
+        return self.key
+
+class WizardStep(models.Model):
+    """
+    The data and the file metadata of a single step of a `WizardInstance`,
+    both pickled.
+    """
+    instance = models.ForeignKey(WizardInstance, related_name='steps')
+    step = models.CharField(max_length=255)
+    data = models.TextField(default='')
+    files = models.TextField(default='')
+
+    class Meta:
+        unique_together = (('instance', 'step'),)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.step, self.instance)
@@ -0,0 +1,86 @@
+from django import forms
+from django.forms import formsets
+from django.forms.models import BaseModelFormSet
+
+class FormStep(object):
+    """
+    The facts about the form class of a step which don't change between
+    requests, computed once when the wizard is created. `kind` is one of
+    'form', 'modelform', 'formset' and 'modelformset', `instance_kwarg`
+    names the constructor argument taking the object returned by
+    `get_form_instance`, if the form accepts one. `has_file_fields` only
+    knows the fields declared on the form class, fields added in `__init__`
+    aren't seen.
+    """
+
+    def __init__(self, name, form_class):
+        self.name = name
+        self.form_class = form_class
+        self.prefix = str(name)
+        self.instance_kwarg = None
+        if issubclass(form_class, forms.ModelForm):
+            self.kind = 'modelform'
+            self.instance_kwarg = 'instance'
+        elif issubclass(form_class, BaseModelFormSet):
+            self.kind = 'modelformset'
+            self.instance_kwarg = 'queryset'
+        elif issubclass(form_class, formsets.BaseFormSet):
+            self.kind = 'formset'
+        else:
+            self.kind = 'form'
+
+        if self.kind in ('formset', 'modelformset'):
+            form_class = form_class.form
+        self.has_file_fields = bool([True
+            for f in form_class.base_fields.values()
+            if isinstance(f, forms.FileField)])
+
+class StepGraph(object):
+    """
+    The resolved list of steps for one request. `form_list` contains only
+    the steps whose conditions passed, `revision` is the storage
+    `data_revision` the conditions were evaluated against.
+
+    Positions and the next/previous links are computed when the graph is
+    built, so all navigation lookups are constant time.
+    """
+
+    def __init__(self, form_list, revision):
+        self.form_list = form_list
+        self.revision = revision
+        self.steps = list(form_list.keyOrder)
+        self.positions = dict((step, i) for i, step in enumerate(self.steps))
+        self.next_steps = dict(zip(self.steps, self.steps[1:] + [None]))
+        self.prev_steps = dict(zip(self.steps, [None] + self.steps[:-1]))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __contains__(self, step):
+        return step in self.positions
+
+    @property
+    def first(self):
+        return self.steps[0]
+
+    @property
+    def last(self):
+        return self.steps[-1]
+
+    def index(self, step):
+        try:
+            return self.positions[step]
+        except KeyError:
+            raise ValueError('%r is not a step of this wizard' % step)
+
+    def next(self, step):
+        try:
+            return self.next_steps[step]
+        except KeyError:
+            raise ValueError('%r is not a step of this wizard' % step)
+
+    def prev(self, step):
+        try:
+            return self.prev_steps[step]
+        except KeyError:
+            raise ValueError('%r is not a step of this wizard' % step)
@@ -11,7 +11,19 @@ class MissingStorageModuleException(ImproperlyConfigured):
 class MissingStorageClassException(ImproperlyConfigured):
     pass
 
-def get_storage(path, *args, **kwargs):
+_storage_classes = {}
+
+def get_storage_class(path):
+    """
+    Returns the storage class for `path`, which is either a dotted path to
+    the class or the storage class itself. Dotted paths are only imported
+    once, the resolved classes are kept in a module level registry.
+    """
+    if not isinstance(path, basestring):
+        return path
+    if path in _storage_classes:
+        return _storage_classes[path]
+
     i = path.rfind('.')
     module, attr = path[:i], path[i+1:]
     try:
@@ -22,4 +34,8 @@ def get_storage(path, *args, **kwargs):
         storage_class = getattr(mod, attr)
     except AttributeError:
         raise MissingStorageClassException('Module "%s" does not define a storage named "%s"' % (module, attr))
-    return storage_class(*args, **kwargs)
+    _storage_classes[path] = storage_class
+    return storage_class
+
+def get_storage(path, *args, **kwargs):
+    return get_storage_class(path)(*args, **kwargs)
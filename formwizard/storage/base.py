@@ -1,9 +1,90 @@
+from django.core.files.uploadedfile import UploadedFile
+from formwizard.models import TemporaryUpload
+
 class NoFileStorageException(Exception):
     pass
 
+class StorageConflict(Exception):
+    """
+    Raised by storages supporting versioned state when the state was
+    changed by another request since it was loaded.
+    """
+    pass
+
+class LazyUploadedFile(UploadedFile):
+    """
+    An `UploadedFile` for a file saved in the wizard's file storage. The
+    stored file is opened on first access only, name, size, content type and
+    charset come from the metadata saved with the step. Closing the file
+    releases the file handle, a later read opens the file again.
+    """
+    def __init__(self, file_storage, tmp_name, name=None, content_type=None,
+        size=None, charset=None):
+        self.file_storage = file_storage
+        self.tmp_name = tmp_name
+        self._file = None
+        super(LazyUploadedFile, self).__init__(None, name, content_type, size,
+            charset)
+
+    def _get_file(self):
+        if self._file is None:
+            self._file = self.file_storage.open(self.tmp_name)
+        return self._file
+
+    def _set_file(self, file):
+        self._file = file
+
+    file = property(_get_file, _set_file)
+
+    def _get_closed(self):
+        return self._file is None or self._file.closed
+    closed = property(_get_closed)
+
+    def open(self, mode=None):
+        if self.closed:
+            self._file = self.file_storage.open(self.tmp_name, mode or 'rb')
+        else:
+            self.seek(0)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 class BaseStorage(object):
     def __init__(self, prefix):
         self.prefix = 'formwizard_%s' % prefix
+        self.data_revision = 0
+        self.request_cache = {}
+        self.stored_files = []
+        self.released_files = []
+
+    def get_version(self):
+        """
+        Returns the version of the stored state, which is increased by every
+        request changing it, or None if the storage doesn't keep versions.
+        Storages keeping versions raise `StorageConflict` on the first write
+        of a request if the version changed since the state was loaded.
+        """
+        return None
+
+    def claim(self):
+        """
+        Makes sure the state can be changed by the current request, raises
+        `StorageConflict` if it was changed by another request since it was
+        loaded. Storages keeping versions call it before the first write,
+        the wizard calls it before actions which can't be repeated, like
+        `done`. Does nothing by default.
+        """
+        pass
+
+    def data_changed(self):
+        """
+        Has to be called by the backends whenever step data, files or extra
+        context change. Values in `request_cache` that depend on the stored
+        data compare `data_revision` to find out if they are outdated.
+        """
+        self.data_revision += 1
 
     def get_current_step(self):
         raise NotImplementedError()
@@ -23,9 +104,89 @@ class BaseStorage(object):
     def get_step_files(self, step):
         raise NotImplementedError()
 
+    def prefetch_steps(self, steps):
+        """
+        Called before the data and files of all `steps` are read. Backends
+        which can load many steps at once, like the `CacheStorage`, load them
+        here instead of with one round trip per step.
+        """
+        pass
+
+    def get_steps_data(self, steps):
+        """
+        Returns a dictionary mapping each of `steps` to its data. By default
+        the steps are prefetched and read using `get_step_data`.
+        """
+        self.prefetch_steps(steps)
+        return dict([(step, self.get_step_data(step)) for step in steps])
+
+    def get_steps_files(self, steps):
+        """
+        Returns a dictionary mapping each of `steps` to its files. By default
+        the steps are prefetched and read using `get_step_files`.
+        """
+        self.prefetch_steps(steps)
+        return dict([(step, self.get_step_files(step)) for step in steps])
+
     def set_step_files(self, step, files):
         raise NotImplementedError()
 
+    def get_stored_file(self, file_dict):
+        """
+        Returns a `LazyUploadedFile` for the metadata dictionary of a stored
+        file. The file gets closed by `close_files`.
+        """
+        stored_file = LazyUploadedFile(self.file_storage,
+            tmp_name=file_dict['tmp_name'],
+            name=file_dict['name'],
+            content_type=file_dict['content_type'],
+            size=file_dict['size'],
+            charset=file_dict['charset'],
+        )
+        self.stored_files.append(stored_file)
+        return stored_file
+
+    def store_file(self, uploaded_file):
+        """
+        Saves an uploaded file to the file storage and returns the metadata
+        dictionary to keep with the step. Files with identical content are
+        stored only once, see `TemporaryUpload`.
+        """
+        upload = TemporaryUpload.objects.store(self.file_storage, uploaded_file)
+        return {
+            'tmp_name': upload.tmp_name,
+            'name': uploaded_file.name,
+            'content_type': uploaded_file.content_type,
+            'size': upload.size,
+            'charset': uploaded_file.charset
+        }
+
+    def release_stored_file(self, file_dict):
+        """
+        Releases a file stored with `store_file`, it gets deleted once no
+        step references it anymore. The reference is given back by
+        `close_files` at the end of the request.
+        """
+        self.released_files.append(file_dict['tmp_name'])
+
+    def close_files(self):
+        """
+        Closes all stored files opened during the current request and gives
+        back the references to the files released during the request.
+        Files which were handed out during the request, for example to
+        `done`, stay readable after the request and are deleted by the
+        `formwizard_cleanup` command once they aren't referenced anymore.
+        """
+        handed_out = set()
+        for stored_file in self.stored_files:
+            stored_file.close()
+            handed_out.add(stored_file.tmp_name)
+        for tmp_name in self.released_files:
+            TemporaryUpload.objects.release(self.file_storage, tmp_name,
+                keep=tmp_name in handed_out)
+        self.stored_files = []
+        self.released_files = []
+
     def get_extra_context_data(self):
         raise NotImplementedError()
 
@@ -35,5 +196,12 @@ class BaseStorage(object):
     def reset(self):
         raise NotImplementedError()
 
+    def delete(self):
+        """
+        Removes the wizard state from the storage, used to drop wizard
+        instances which aren't needed anymore. By default the state is reset.
+        """
+        return self.reset()
+
     def update_response(self, response):
         raise NotImplementedError()
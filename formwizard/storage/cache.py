@@ -0,0 +1,231 @@
+import os
+
+from django.core.cache import cache, get_cache
+from django.utils.hashcompat import md5_constructor
+from formwizard.models import get_wizard_expiry
+from formwizard.storage.base import BaseStorage, NoFileStorageException, \
+    StorageConflict
+
+class CacheStorage(BaseStorage):
+    """
+    Stores the wizard state using Django's cache framework. A small index
+    key holds the current step, the extra context and the names of the
+    stored steps, the data and file metadata of every step is kept under
+    its own key. Saving a step only writes the key of that step and, if it
+    changed, the index.
+
+    The wizard is identified by a random key kept in a cookie. Set
+    `cache_backend` to a cache URI to use another cache than the default
+    one. Keys expire after `FORMWIZARD_STORAGE_EXPIRY` seconds.
+
+    The first write of a request claims the next version of the state by
+    adding a key for it. If another request claimed it already since the
+    index was loaded, `StorageConflict` is raised.
+    """
+    cache_backend = None
+    step_cache_key = 'step'
+    steps_cache_key = 'steps'
+    extra_context_cache_key = 'extra_context'
+    version_cache_key = 'version'
+
+    def __init__(self, prefix, request, file_storage=None, *args, **kwargs):
+        super(CacheStorage, self).__init__(prefix)
+        self.request = request
+        self.file_storage = file_storage
+        if self.cache_backend:
+            self.cache = get_cache(self.cache_backend)
+        else:
+            self.cache = cache
+        self.key_changed = False
+        self.claimed = False
+        self.deleted = False
+        # (data, files) tuples of the loaded steps
+        self.steps = {}
+        self.key = self.request.COOKIES.get(self.prefix, None)
+        self.index = None
+        if self.key:
+            self.index = self.cache.get(self.get_index_key(), None)
+        if self.index is None:
+            self.key = None
+            self.index = self.get_initial_index()
+
+    def get_initial_index(self, version=0):
+        return {
+            self.step_cache_key: None,
+            self.steps_cache_key: [],
+            self.extra_context_cache_key: {},
+            self.version_cache_key: version,
+        }
+
+    def get_version(self):
+        return self.index.get(self.version_cache_key, 0)
+
+    def get_timeout(self):
+        expiry = get_wizard_expiry()
+        return expiry.days * 86400 + expiry.seconds
+
+    def get_index_key(self):
+        return '%s:%s' % (self.prefix, self.key)
+
+    def get_version_key(self, version):
+        return '%s:%s:v%d' % (self.prefix, self.key, version)
+
+    def get_step_key(self, step):
+        return '%s:%s:%s' % (self.prefix, self.key,
+            md5_constructor(unicode(step).encode('utf-8')).hexdigest())
+
+    def claim(self):
+        """
+        Makes sure the state can be changed by the current request, called
+        before anything is written. The next version is claimed by adding
+        its key, which only succeeds for one request.
+        """
+        if self.claimed:
+            return
+        if self.key is None:
+            self.key = os.urandom(20).encode('hex')
+            self.key_changed = True
+            self.claimed = True
+            return
+
+        version = self.get_version() + 1
+        if not self.cache.add(self.get_version_key(version), True,
+            self.get_timeout()):
+            raise StorageConflict('Wizard %s was changed by another request'
+                % self.key)
+        self.index[self.version_cache_key] = version
+        self.claimed = True
+        # store the new version even if only step keys are written
+        self.cache.set(self.get_index_key(), self.index, self.get_timeout())
+
+    def save_index(self):
+        self.claim()
+        self.cache.set(self.get_index_key(), self.index, self.get_timeout())
+
+    def load_step(self, step):
+        if step not in self.steps:
+            self.prefetch_steps([step])
+        return self.steps[step]
+
+    def prefetch_steps(self, steps):
+        """
+        Loads all `steps` which weren't loaded yet with a single `get_many`.
+        """
+        steps = [step for step in steps if step not in self.steps]
+        stored_steps = [step for step in steps
+            if step in self.index[self.steps_cache_key]]
+        values = {}
+        if stored_steps:
+            values = self.cache.get_many(
+                [self.get_step_key(step) for step in stored_steps])
+        for step in steps:
+            self.steps[step] = values.get(self.get_step_key(step),
+                (None, None))
+
+    def save_step(self, step, data, files):
+        self.claim()
+        if step not in self.index[self.steps_cache_key]:
+            self.index[self.steps_cache_key].append(step)
+            self.save_index()
+        self.cache.set(self.get_step_key(step), (data, files),
+            self.get_timeout())
+        self.steps[step] = (data, files)
+        self.data_changed()
+
+    def init_storage(self):
+        if self.key is not None:
+            self.claim()
+            self.cache.delete_many([self.get_step_key(step)
+                for step in self.index[self.steps_cache_key]])
+            self.index = self.get_initial_index(self.get_version())
+            self.save_index()
+        self.steps = {}
+        self.data_changed()
+        return True
+
+    def get_current_step(self):
+        return self.index[self.step_cache_key]
+
+    def set_current_step(self, step):
+        if self.index[self.step_cache_key] != step:
+            self.index[self.step_cache_key] = step
+            self.save_index()
+        return True
+
+    def get_step_data(self, step):
+        return self.load_step(step)[0]
+
+    def get_current_step_data(self):
+        return self.get_step_data(self.get_current_step())
+
+    def set_step_data(self, step, cleaned_data):
+        self.save_step(step, cleaned_data, self.load_step(step)[1])
+        return True
+
+    def set_step_files(self, step, files):
+        if files and not self.file_storage:
+            raise NoFileStorageException
+
+        if not files:
+            return True
+
+        self.claim()
+        data, step_files = self.load_step(step)
+        step_files = dict(step_files or {})
+        for field, field_file in files.items():
+            file_dict = self.store_file(field_file)
+            if step_files.has_key(field):
+                self.release_stored_file(step_files[field])
+            step_files[field] = file_dict
+
+        self.save_step(step, data, step_files)
+        return True
+
+    def get_current_step_files(self):
+        return self.get_step_files(self.get_current_step())
+
+    def get_step_files(self, step):
+        step_files = self.load_step(step)[1] or {}
+
+        if step_files and not self.file_storage:
+            raise NoFileStorageException
+
+        files = {}
+        for field, field_dict in step_files.items():
+            files[field] = self.get_stored_file(field_dict)
+        return files or None
+
+    def get_extra_context_data(self):
+        return self.index[self.extra_context_cache_key] or {}
+
+    def set_extra_context_data(self, extra_context):
+        self.index[self.extra_context_cache_key] = extra_context
+        self.save_index()
+        self.data_changed()
+        return True
+
+    def reset(self):
+        if self.key is not None:
+            self.claim()
+        if self.file_storage:
+            self.prefetch_steps(self.index[self.steps_cache_key])
+            for data, step_files in self.steps.values():
+                for file_dict in (step_files or {}).values():
+                    self.release_stored_file(file_dict)
+        return self.init_storage()
+
+    def delete(self):
+        if self.key is not None:
+            self.reset()
+            self.cache.delete(self.get_index_key())
+            self.key = None
+            self.deleted = True
+        return True
+
+    def update_response(self, response):
+        if self.deleted and self.request.COOKIES.has_key(self.prefix):
+            response.delete_cookie(self.prefix)
+        if self.key_changed:
+            response.set_cookie(self.prefix, self.key)
+            self.key_changed = False
+        return response
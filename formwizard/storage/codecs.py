@@ -0,0 +1,164 @@
+import base64
+import zlib
+
+from django.utils import simplejson as json
+
+class CodecError(ValueError):
+    pass
+
+class JSONCodec(object):
+    """
+    Encodes the cookie payload as compact JSON. This is the original cookie
+    format, payloads of other codecs can't be decoded.
+    """
+    def encode(self, data):
+        encoder = json.JSONEncoder(separators=(',', ':'))
+        return encoder.encode(data)
+
+    def decode(self, payload):
+        try:
+            return json.loads(payload, cls=json.JSONDecoder)
+        except ValueError, e:
+            raise CodecError(str(e))
+
+class BinaryCodec(object):
+    """
+    Encodes the cookie payload in a compact binary format, compressed with
+    zlib if it is longer than `compress_threshold` bytes. The result is
+    url-safe base64 encoded and tagged with the format version, so cookies
+    don't need any quoting.
+
+    Supported are None, bools, integers, floats, strings, lists, tuples and
+    dictionaries. Like with JSON, tuples are decoded as lists and dictionary
+    subclasses like `QueryDict` as dictionaries of their `items()`.
+
+    Payloads without a tag are decoded as JSON, so cookies written by the
+    `JSONCodec` stay readable.
+    """
+    version = '1'
+    compress_threshold = 200
+
+    def encode(self, data):
+        chunks = []
+        self.encode_value(data, chunks)
+        payload = ''.join(chunks)
+        if len(payload) > self.compress_threshold:
+            flag, payload = 'z', zlib.compress(payload, 9)
+        else:
+            flag = 'b'
+        return '~%s%s%s' % (self.version, flag,
+            base64.urlsafe_b64encode(payload).rstrip('='))
+
+    def decode(self, payload):
+        if not payload.startswith('~'):
+            return JSONCodec().decode(payload)
+        if payload[1:2] != self.version or payload[2:3] not in ('b', 'z'):
+            raise CodecError('Unknown payload format %r' % payload[:3])
+        try:
+            data = payload[3:]
+            data = base64.urlsafe_b64decode(str(data + '=' * (-len(data) % 4)))
+            if payload[2] == 'z':
+                data = zlib.decompress(data)
+            value, pos = self.decode_value(data, 0)
+        except (TypeError, ValueError, IndexError, KeyError, zlib.error), e:
+            raise CodecError('Invalid payload: %s' % e)
+        if pos != len(data):
+            raise CodecError('Invalid payload: trailing data')
+        return value
+
+    def encode_value(self, value, chunks):
+        if value is None:
+            chunks.append('N')
+        elif value is True:
+            chunks.append('T')
+        elif value is False:
+            chunks.append('F')
+        elif isinstance(value, (int, long)):
+            if value < 0:
+                chunks.extend(('-', encode_length(-value)))
+            else:
+                chunks.extend(('i', encode_length(value)))
+        elif isinstance(value, float):
+            self.encode_string('f', repr(value), chunks)
+        elif isinstance(value, unicode):
+            self.encode_string('u', value.encode('utf-8'), chunks)
+        elif isinstance(value, str):
+            self.encode_string('s', value, chunks)
+        elif isinstance(value, (list, tuple)):
+            chunks.extend(('l', encode_length(len(value))))
+            for item in value:
+                self.encode_value(item, chunks)
+        elif isinstance(value, dict):
+            items = value.items()
+            chunks.extend(('d', encode_length(len(items))))
+            for key, item in items:
+                self.encode_value(key, chunks)
+                self.encode_value(item, chunks)
+        else:
+            raise TypeError('%r is not serializable' % (value,))
+
+    def encode_string(self, tag, value, chunks):
+        chunks.extend((tag, encode_length(len(value)), value))
+
+    def decode_value(self, data, pos):
+        tag = data[pos]
+        pos += 1
+        if tag == 'N':
+            return None, pos
+        elif tag == 'T':
+            return True, pos
+        elif tag == 'F':
+            return False, pos
+        elif tag == 'i':
+            return decode_length(data, pos)
+        elif tag == '-':
+            value, pos = decode_length(data, pos)
+            return -value, pos
+        elif tag in ('f', 'u', 's'):
+            length, pos = decode_length(data, pos)
+            value = data[pos:pos + length]
+            if len(value) != length:
+                raise IndexError('string out of range')
+            if tag == 'f':
+                return float(value), pos + length
+            elif tag == 'u':
+                return value.decode('utf-8'), pos + length
+            return value, pos + length
+        elif tag == 'l':
+            length, pos = decode_length(data, pos)
+            value = []
+            for i in xrange(length):
+                item, pos = self.decode_value(data, pos)
+                value.append(item)
+            return value, pos
+        elif tag == 'd':
+            length, pos = decode_length(data, pos)
+            value = {}
+            for i in xrange(length):
+                key, pos = self.decode_value(data, pos)
+                value[key], pos = self.decode_value(data, pos)
+            return value, pos
+        raise KeyError('unknown tag %r' % tag)
+
+def encode_length(value):
+    """
+    Encodes a non-negative integer with 7 bits per byte, so small numbers
+    need a single byte.
+    """
+    chunks = []
+    while value > 0x7f:
+        chunks.append(chr(value & 0x7f | 0x80))
+        value >>= 7
+    chunks.append(chr(value))
+    return ''.join(chunks)
+
+def decode_length(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = ord(data[pos])
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
@@ -1,16 +1,70 @@
+import copy
 import hmac
+import re
+import string
 
 from django.conf import settings
 from django.core.exceptions import SuspiciousOperation
 from django.utils.hashcompat import sha_constructor
-from django.utils import simplejson as json
 from formwizard.storage.base import BaseStorage, NoFileStorageException
-from django.core.files.uploadedfile import UploadedFile
-from django.core.files import File
+from formwizard.storage.codecs import JSONCodec, CodecError
 
 sha_hmac = sha_constructor
 
+# characters which can be used in a cookie value without quoting
+COOKIE_SAFE_CHARS = frozenset(string.ascii_letters + string.digits +
+    "!#$%&'*+-.^_`|~")
+
+def split_cookie_value(value, max_size):
+    """
+    Splits `value` into chunks which take at most `max_size` bytes each once
+    quoted for the `Set-Cookie` header.
+    """
+    if not [True for char in value if char not in COOKIE_SAFE_CHARS]:
+        return [value[i:i + max_size] for i in range(0, len(value), max_size)]
+
+    chunks = []
+    chunk = []
+    # quoted values are wrapped in double quotes
+    size = 2
+    for char in value:
+        if char in COOKIE_SAFE_CHARS:
+            char_size = 1
+        elif char in '"\\':
+            char_size = 2
+        else:
+            char_size = 4
+        if size + char_size > max_size:
+            chunks.append(''.join(chunk))
+            chunk = []
+            size = 2
+        chunk.append(char)
+        size += char_size
+    chunks.append(''.join(chunk))
+    return chunks
+
 class CookieStorage(BaseStorage):
+    """
+    Stores the wizard state in a signed cookie. The payload is serialized
+    using `codec`, use `formwizard.storage.codecs.BinaryCodec` for smaller
+    cookies.
+
+    If the signed payload doesn't fit into `max_cookie_size` bytes, it is
+    split over numbered cookies. The first cookie then only contains the
+    number of chunks and the signature, the chunks are stored in cookies
+    named `<prefix>-1`, `<prefix>-2` and so on. Chunks the browser already
+    has are not sent again. The chunks are slices of the whole encoded
+    payload, so this mostly helps if only the end of the payload changes:
+    a change of its length moves all later chunk boundaries, and with a
+    compressing codec like the `BinaryCodec` any change usually changes the
+    whole payload.
+
+    Cookies are only written if the data differs from the data loaded from
+    the cookie at the start of the request.
+    """
+    codec = JSONCodec()
+    max_cookie_size = 4000
+    max_cookie_chunks = 40
     step_cookie_key = 'step'
     step_data_cookie_key = 'step_data'
     step_files_cookie_key = 'step_files'
@@ -20,17 +74,41 @@ class CookieStorage(BaseStorage):
         super(CookieStorage, self).__init__(prefix)
         self.file_storage = file_storage
         self.request = request
+        # the signed payload the cookie data was loaded from
+        self.loaded_cookie_data = None
         self.cookie_data = self.load_cookie_data()
         if self.cookie_data is None:
             self.init_storage()
+        self.snapshot = self.get_snapshot()
+        if self.loaded_cookie_data is None and \
+            self.request.COOKIES.has_key(self.prefix):
+            # replace cookies which couldn't be loaded
+            self.snapshot = None
+
+    def get_snapshot(self):
+        """
+        Returns a copy of the cookie data to detect changes. Step data is
+        always replaced, never changed in place, so it isn't copied.
+        """
+        snapshot = copy.copy(self.cookie_data)
+        for key in (self.step_data_cookie_key, self.extra_context_cookie_key):
+            if snapshot.has_key(key):
+                snapshot[key] = copy.copy(snapshot[key])
+        if snapshot.has_key(self.step_files_cookie_key):
+            snapshot[self.step_files_cookie_key] = copy.deepcopy(
+                snapshot[self.step_files_cookie_key])
+        return snapshot
 
     def init_storage(self):
-        self.cookie_data = {
+        initial_data = {
             self.step_cookie_key: None,
             self.step_data_cookie_key: {},
             self.step_files_cookie_key: {},
             self.extra_context_cookie_key: {},
         }
+        if self.cookie_data != initial_data:
+            self.cookie_data = initial_data
+            self.data_changed()
         return True
 
     def get_current_step(self):
@@ -48,27 +126,24 @@ class CookieStorage(BaseStorage):
 
     def set_step_data(self, step, cleaned_data):
         self.cookie_data[self.step_data_cookie_key][step] = cleaned_data
+        self.data_changed()
         return True
 
-
     def set_step_files(self, step, files):
         if files and not self.file_storage:
             raise NoFileStorageException
 
         if not self.cookie_data[self.step_files_cookie_key].has_key(step):
             self.cookie_data[self.step_files_cookie_key][step] = {}
+        step_files = self.cookie_data[self.step_files_cookie_key][step]
 
         for field, field_file in (files or {}).items():
-            tmp_filename = self.file_storage.save(field_file.name, field_file)
-            file_dict = {
-                'tmp_name': tmp_filename,
-                'name': field_file.name,
-                'content_type': field_file.content_type,
-                'size': field_file.size,
-                'charset': field_file.charset
-            }
-            self.cookie_data[self.step_files_cookie_key][step][field] = file_dict
+            file_dict = self.store_file(field_file)
+            if step_files.has_key(field):
+                self.release_stored_file(step_files[field])
+            step_files[field] = file_dict
 
+        self.data_changed()
         return True
 
     def get_current_step_files(self):
@@ -82,13 +157,7 @@ class CookieStorage(BaseStorage):
 
         files = {}
         for field, field_dict in session_files.items():
-            files[field] = UploadedFile(
-                file=self.file_storage.open(field_dict['tmp_name']),
-                name=field_dict['name'],
-                content_type=field_dict['content_type'],
-                size=field_dict['size'],
-                charset=field_dict['charset'],
-            )
+            files[field] = self.get_stored_file(field_dict)
         return files or None
 
     def get_extra_context_data(self):
@@ -96,34 +165,119 @@ class CookieStorage(BaseStorage):
 
     def set_extra_context_data(self, extra_context):
         self.cookie_data[self.extra_context_cookie_key] = extra_context
+        self.data_changed()
         return True
 
     def reset(self):
+        if self.file_storage:
+            for step_fields in self.cookie_data[self.step_files_cookie_key].values():
+                for file_dict in step_fields.values():
+                    self.release_stored_file(file_dict)
         return self.init_storage()
 
+    def delete(self):
+        self.reset()
+        self.cookie_data = {}
+        return True
+
     def update_response(self, response):
+        """
+        Writes the cookies if the data changed since it was loaded. Only
+        cookies whose value differs from the one the browser sent are set.
+        """
+        if self.cookie_data == self.snapshot:
+            return response
+
         if len(self.cookie_data) > 0:
-            response.set_cookie(self.prefix, self.create_cookie_data(self.cookie_data))
+            cookies = self.create_cookies(self.cookie_data)
         else:
+            cookies = []
             response.delete_cookie(self.prefix)
+
+        for name, value in cookies:
+            if self.request.COOKIES.get(name, None) != value:
+                response.set_cookie(name, value)
+
+        chunk_names = set([name for name, value in cookies])
+        for name in self.request.COOKIES.keys():
+            if self.is_chunk_name(name) and name not in chunk_names:
+                response.delete_cookie(name)
+        self.snapshot = self.get_snapshot()
         return response
 
+    def get_chunk_name(self, index):
+        return '%s-%d' % (self.prefix, index)
+
+    def is_chunk_name(self, name):
+        return re.match(r'^%s-\d+$' % re.escape(self.prefix), name) is not None
+
     def load_cookie_data(self):
         data = self.request.COOKIES.get(self.prefix, None)
         if data is None:
             return None
 
+        if '$' not in data:
+            data = self.join_cookie_chunks(data)
+            if data is None:
+                return None
+
         bits = data.split('$', 1)
         if len(bits) == 2:
             if bits[0] == self.get_cookie_hash(bits[1]):
-                return json.loads(bits[1], cls=json.JSONDecoder)
+                try:
+                    cookie_data = self.codec.decode(bits[1])
+                    self.loaded_cookie_data = data
+                    return cookie_data
+                except CodecError:
+                    # signed by us, but written in an unknown format
+                    return None
 
         raise SuspiciousOperation('FormWizard cookie manipulated')
 
+    def join_cookie_chunks(self, data):
+        """
+        Returns the signed payload for a first cookie of the form
+        `<number of chunks>:<signature>`, or None if the browser didn't send
+        all chunks.
+        """
+        bits = data.split(':', 1)
+        if len(bits) != 2 or not bits[0].isdigit() or \
+            not 0 < int(bits[0]) <= self.max_cookie_chunks:
+            raise SuspiciousOperation('FormWizard cookie manipulated')
+
+        chunks = [self.request.COOKIES.get(self.get_chunk_name(i), None)
+            for i in range(1, int(bits[0]) + 1)]
+        if None in chunks:
+            return None
+        return '%s$%s' % (bits[1], ''.join(chunks))
+
     def get_cookie_hash(self, data):
         return hmac.new('%s$%s' % (settings.SECRET_KEY, self.prefix), data, sha_hmac).hexdigest()
 
     def create_cookie_data(self, data):
-        encoder = json.JSONEncoder(separators=(',', ':'))
-        encoded_data = encoder.encode(data)
+        encoded_data = self.codec.encode(data)
+        if self.loaded_cookie_data is not None and \
+            self.loaded_cookie_data.split('$', 1)[1] == encoded_data:
+            # no need to sign the payload again
+            return self.loaded_cookie_data
         return '%s$%s' % (self.get_cookie_hash(encoded_data), encoded_data)
+
+    def create_cookies(self, data):
+        """
+        Returns a list of (cookie name, value) tuples for `data`, which is a
+        single cookie if the signed payload is small enough. Otherwise the
+        payload is cut into fixed-size chunks, not into chunks per step.
+        """
+        cookie_data = self.create_cookie_data(data)
+        if len(split_cookie_value(cookie_data, self.max_cookie_size)) == 1:
+            return [(self.prefix, cookie_data)]
+
+        cookie_hash, encoded_data = cookie_data.split('$', 1)
+        chunks = split_cookie_value(encoded_data, self.max_cookie_size)
+        if len(chunks) > self.max_cookie_chunks:
+            raise ValueError('FormWizard data needs more than %d cookies' %
+                self.max_cookie_chunks)
+        cookies = [(self.prefix, '%d:%s' % (len(chunks), cookie_hash))]
+        for i, chunk in enumerate(chunks):
+            cookies.append((self.get_chunk_name(i + 1), chunk))
+        return cookies
@@ -0,0 +1,219 @@
+from datetime import datetime
+import os
+
+from formwizard.models import WizardInstance, WizardStep, \
+    get_wizard_expiry, encode_value, decode_value
+from formwizard.storage.base import BaseStorage, NoFileStorageException, \
+    StorageConflict
+
+class DBStorage(BaseStorage):
+    """
+    Stores the wizard state in the database, with one row per step, so
+    only the rows of the steps used during a request are read and written.
+    The wizard is identified by a random key kept in a cookie. Add
+    `formwizard` to `INSTALLED_APPS` to use this storage and run the
+    `formwizard_cleanup` command to delete the state of abandoned wizards.
+
+    The first write of a request increases the version of the wizard only
+    if it didn't change since it was loaded, otherwise `StorageConflict`
+    is raised before anything is written.
+    """
+    def __init__(self, prefix, request, file_storage=None, *args, **kwargs):
+        super(DBStorage, self).__init__(prefix)
+        self.request = request
+        self.file_storage = file_storage
+        self.instance = None
+        self.key_changed = False
+        self.claimed = False
+        self.deleted = False
+        # decoded (data, files) tuples of the loaded steps
+        self.steps = {}
+        key = self.request.COOKIES.get(self.prefix, None)
+        if key:
+            try:
+                self.instance = WizardInstance.objects.get(key=key,
+                    expires__gte=datetime.now())
+            except WizardInstance.DoesNotExist:
+                pass
+
+    def create_key(self):
+        return os.urandom(20).encode('hex')
+
+    def get_version(self):
+        if self.instance is None:
+            return 0
+        return self.instance.version
+
+    def save_instance(self, **fields):
+        """
+        Updates `fields` of the wizard and its expiry date, the wizard is
+        created on first use. The first update of a request increases the
+        version if it still is the loaded one.
+        """
+        fields['expires'] = datetime.now() + get_wizard_expiry()
+        if self.instance is None:
+            self.instance = WizardInstance.objects.create(
+                key=self.create_key(), **fields)
+            self.key_changed = True
+        else:
+            instances = WizardInstance.objects.filter(pk=self.instance.pk)
+            if not self.claimed:
+                instances = instances.filter(version=self.instance.version)
+                fields['version'] = self.instance.version + 1
+            if not instances.update(**fields):
+                raise StorageConflict('Wizard %s was changed by another '
+                    'request' % self.instance.key)
+            for name, value in fields.items():
+                setattr(self.instance, name, value)
+        self.claimed = True
+
+    def claim(self):
+        """
+        Makes sure the state can be changed by the current request, called
+        before anything is written.
+        """
+        if not self.claimed:
+            self.save_instance()
+
+    def load_step(self, step):
+        if step not in self.steps:
+            self.prefetch_steps([step])
+        return self.steps[step]
+
+    def prefetch_steps(self, steps):
+        """
+        Loads all `steps` which weren't loaded yet with a single query.
+        """
+        steps = [step for step in steps if step not in self.steps]
+        for step in steps:
+            self.steps[step] = (None, None)
+        if self.instance is None or not steps:
+            return
+        rows = WizardStep.objects.filter(instance=self.instance,
+            step__in=steps).values_list('step', 'data', 'files')
+        for step, data, files in rows:
+            # an empty column stands for None, empty values are encoded
+            self.steps[step] = (self.decode_column(data),
+                self.decode_column(files))
+
+    def encode_column(self, value):
+        if value is None:
+            return ''
+        return encode_value(value)
+
+    def decode_column(self, data):
+        if not data:
+            return None
+        return decode_value(data)
+
+    def save_step(self, step, data, files):
+        self.claim()
+        fields = {
+            'data': self.encode_column(data),
+            'files': self.encode_column(files),
+        }
+        if not WizardStep.objects.filter(instance=self.instance,
+            step=step).update(**fields):
+            WizardStep.objects.create(instance=self.instance, step=step,
+                **fields)
+        self.steps[step] = (data, files)
+        self.data_changed()
+
+    def init_storage(self):
+        if self.instance is not None:
+            self.claim()
+            WizardStep.objects.filter(instance=self.instance).delete()
+            self.save_instance(current_step=None, extra_context='')
+        self.steps = {}
+        self.data_changed()
+        return True
+
+    def get_current_step(self):
+        if self.instance is None:
+            return None
+        return self.instance.current_step
+
+    def set_current_step(self, step):
+        if self.get_current_step() != step:
+            self.save_instance(current_step=step)
+        return True
+
+    def get_step_data(self, step):
+        return self.load_step(step)[0]
+
+    def get_current_step_data(self):
+        return self.get_step_data(self.get_current_step())
+
+    def set_step_data(self, step, cleaned_data):
+        self.save_step(step, cleaned_data, self.load_step(step)[1])
+        return True
+
+    def set_step_files(self, step, files):
+        if files and not self.file_storage:
+            raise NoFileStorageException
+
+        if not files:
+            return True
+
+        self.claim()
+        data, step_files = self.load_step(step)
+        step_files = dict(step_files or {})
+        for field, field_file in files.items():
+            file_dict = self.store_file(field_file)
+            if step_files.has_key(field):
+                self.release_stored_file(step_files[field])
+            step_files[field] = file_dict
+
+        self.save_step(step, data, step_files)
+        return True
+
+    def get_current_step_files(self):
+        return self.get_step_files(self.get_current_step())
+
+    def get_step_files(self, step):
+        step_files = self.load_step(step)[1] or {}
+
+        if step_files and not self.file_storage:
+            raise NoFileStorageException
+
+        files = {}
+        for field, field_dict in step_files.items():
+            files[field] = self.get_stored_file(field_dict)
+        return files or None
+
+    def get_extra_context_data(self):
+        if self.instance is None or not self.instance.extra_context:
+            return {}
+        return decode_value(self.instance.extra_context)
+
+    def set_extra_context_data(self, extra_context):
+        self.save_instance(extra_context=encode_value(extra_context))
+        self.data_changed()
+        return True
+
+    def reset(self):
+        if self.instance is not None:
+            self.claim()
+        if self.file_storage and self.instance is not None:
+            rows = WizardStep.objects.filter(instance=self.instance) \
+                .exclude(files='').values_list('files', flat=True)
+            for files in rows:
+                for file_dict in decode_value(files).values():
+                    self.release_stored_file(file_dict)
+        return self.init_storage()
+
+    def delete(self):
+        if self.instance is not None:
+            self.reset()
+            WizardInstance.objects.filter(pk=self.instance.pk).delete()
+            self.instance = None
+            self.deleted = True
+        return True
+
+    def update_response(self, response):
+        if self.deleted and self.request.COOKIES.has_key(self.prefix):
+            response.delete_cookie(self.prefix)
+        if self.key_changed:
+            response.set_cookie(self.prefix, self.instance.key)
+            self.key_changed = False
+        return response
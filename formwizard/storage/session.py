@@ -1,29 +1,67 @@
 from formwizard.storage.base import BaseStorage, NoFileStorageException
-from django.core.files.uploadedfile import UploadedFile
-from django.core.files import File
+import copy
 import os
 
 class SessionStorage(BaseStorage):
+    """
+    Stores the wizard state in the session. The session is only marked as
+    modified if the state differs from the state loaded at the beginning of
+    the request.
+
+    If `separate_step_keys` is True, the data of every step is stored under
+    its own session key, so only the data of changed steps has to be written
+    by session backends which support partial updates.
+    """
     step_session_key = 'step'
     step_data_session_key = 'step_data'
     step_files_session_key = 'step_files'
     extra_context_session_key = 'extra_context'
-    
+    separate_step_keys = False
+
     def __init__(self, prefix, request, file_storage=None, *args, **kwargs):
         super(SessionStorage, self).__init__(prefix)
         self.request = request
         self.file_storage = file_storage
         if not self.request.session.has_key(self.prefix):
-            self.init_storage()
+            self.request.session[self.prefix] = self.get_initial_data()
+        self.snapshot = self.get_snapshot()
 
-    def init_storage(self):
-        self.request.session[self.prefix] = {
+    def get_initial_data(self):
+        return {
             self.step_session_key: None,
             self.step_data_session_key: {},
             self.step_files_session_key: {},
             self.extra_context_session_key: {},
         }
-        self.request.session.modified = True
+
+    def get_snapshot(self):
+        """
+        Returns a copy of the stored state to detect changes. Step data is
+        always replaced, never changed in place, so it isn't copied.
+        """
+        data = self.request.session[self.prefix]
+        return {
+            self.step_session_key: data[self.step_session_key],
+            self.step_data_session_key: copy.copy(
+                data[self.step_data_session_key]),
+            self.step_files_session_key: copy.deepcopy(
+                data[self.step_files_session_key]),
+            self.extra_context_session_key: copy.copy(
+                data[self.extra_context_session_key]),
+        }
+
+    def get_step_key(self, step):
+        return '%s-%s' % (self.prefix, step)
+
+    def init_storage(self):
+        if self.separate_step_keys:
+            for step in self.request.session[self.prefix][self.step_data_session_key]:
+                if self.request.session.has_key(self.get_step_key(step)):
+                    del self.request.session[self.get_step_key(step)]
+        data = self.request.session[self.prefix]
+        data.clear()
+        data.update(self.get_initial_data())
+        self.data_changed()
         return True
 
     def get_current_step(self):
@@ -31,39 +69,44 @@ class SessionStorage(BaseStorage):
 
     def set_current_step(self, step):
         self.request.session[self.prefix][self.step_session_key] = step
-        self.request.session.modified = True
         return True
 
     def get_step_data(self, step):
+        if self.separate_step_keys:
+            return self.request.session.get(self.get_step_key(step), None)
         return self.request.session[self.prefix][self.step_data_session_key].get(step, None)
 
     def get_current_step_data(self):
         return self.get_step_data(self.get_current_step())
 
     def set_step_data(self, step, cleaned_data):
+        if self.separate_step_keys:
+            if self.get_step_data(step) != cleaned_data:
+                self.request.session[self.get_step_key(step)] = cleaned_data
+            # keep track of the step keys to remove them on reset
+            cleaned_data = True
         self.request.session[self.prefix][self.step_data_session_key][step] = cleaned_data
-        self.request.session.modified = True
+        self.data_changed()
         return True
 
     def set_step_files(self, step, files):
         if files and not self.file_storage:
             raise NoFileStorageException
 
+        if not files:
+            return True
+
         if not self.request.session[self.prefix][self.step_files_session_key].has_key(step):
             self.request.session[self.prefix][self.step_files_session_key][step] = {}
+        step_files = self.request.session[self.prefix][self.step_files_session_key][step]
 
-        for field, field_file in (files or {}).items():
-            tmp_filename = self.file_storage.save(field_file.name, field_file)
-            file_dict = {
-                'tmp_name': tmp_filename,
-                'name': field_file.name,
-                'content_type': field_file.content_type,
-                'size': field_file.size,
-                'charset': field_file.charset
-            }
-            self.request.session[self.prefix][self.step_files_session_key][step][field] = file_dict
-
-        self.request.session.modified = True
+        for field, field_file in files.items():
+            file_dict = self.store_file(field_file)
+            if step_files.has_key(field):
+                self.release_stored_file(step_files[field])
+            step_files[field] = file_dict
+
+        self.data_changed()
         return True
 
     def get_current_step_files(self):
@@ -77,13 +120,7 @@ class SessionStorage(BaseStorage):
 
         files = {}
         for field, field_dict in session_files.items():
-            files[field] = UploadedFile(
-                file=self.file_storage.open(field_dict['tmp_name']),
-                name=field_dict['name'],
-                content_type=field_dict['content_type'],
-                size=field_dict['size'],
-                charset=field_dict['charset'],
-            )
+            files[field] = self.get_stored_file(field_dict)
         return files or None
 
     def get_extra_context_data(self):
@@ -91,15 +128,38 @@ class SessionStorage(BaseStorage):
 
     def set_extra_context_data(self, extra_context):
         self.request.session[self.prefix][self.extra_context_session_key] = extra_context
-        self.request.session.modified = True
+        self.data_changed()
         return True
 
     def reset(self):
         if self.file_storage:
             for step_fields in self.request.session[self.prefix][self.step_files_session_key].values():
                 for file_dict in step_fields.values():
-                    self.file_storage.delete(file_dict['tmp_name'])
+                    self.release_stored_file(file_dict)
         return self.init_storage()
 
+    def delete(self):
+        if self.file_storage:
+            for step_fields in self.request.session[self.prefix][self.step_files_session_key].values():
+                for file_dict in step_fields.values():
+                    self.release_stored_file(file_dict)
+        if self.separate_step_keys:
+            for step in self.request.session[self.prefix][self.step_data_session_key]:
+                if self.request.session.has_key(self.get_step_key(step)):
+                    del self.request.session[self.get_step_key(step)]
+        del self.request.session[self.prefix]
+        self.data_changed()
+        return True
+
     def update_response(self, response):
+        """
+        Marks the session as modified if the wizard state changed during the
+        request.
+        """
+        if not self.request.session.has_key(self.prefix):
+            # deleted, deleting the key marks the session as modified
+            return response
+        if self.request.session[self.prefix] != self.snapshot:
+            self.request.session.modified = True
+            self.snapshot = self.get_snapshot()
         return response
@@ -2,6 +2,9 @@ from formwizard.tests.formtests import *
 from formwizard.tests.basestoragetests import *
 from formwizard.tests.sessionstoragetests import *
 from formwizard.tests.cookiestoragetests import *
+from formwizard.tests.dbstoragetests import *
+from formwizard.tests.cachestoragetests import *
 from formwizard.tests.loadstoragetests import *
+from formwizard.tests.uploadtests import *
 from formwizard.tests.wizardtests import *
 from formwizard.tests.namedwizardtests import *
\ No newline at end of file
@@ -0,0 +1,41 @@
+from formwizard.tests.storagetests import *
+from django.test import TestCase
+from django.http import HttpResponse
+from formwizard.storage.cache import CacheStorage
+
+class CountingCache(object):
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+        def counting_method(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+        return counting_method
+
+class TestCacheStorage(TestVersionedStorage, TestCase):
+    def get_storage(self):
+        return CacheStorage
+
+    def test_cache_calls(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        for step in ('start', 'step2', 'step3'):
+            storage.set_step_data(step, {'%s-name' % step: 'data'})
+        storage.set_current_step('step3')
+        response = storage.update_response(HttpResponse())
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        storage = self.get_storage()('wizard1', request, None)
+        storage.cache = CountingCache(storage.cache)
+        storage.set_step_data('step3', {'step3-name': 'data2'})
+        storage.set_current_step('done')
+        self.assertEqual(storage.cache.calls, ['get_many', 'add', 'set', 'set', 'set'])
+
+        storage.cache.calls = []
+        storage.prefetch_steps(['start', 'step2', 'step3'])
+        self.assertEqual(storage.get_step_data('start'), {'start-name': 'data'})
+        self.assertEqual(storage.get_step_data('step2'), {'step2-name': 'data'})
+        self.assertEqual(storage.cache.calls, ['get_many'])
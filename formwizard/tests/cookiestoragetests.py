@@ -1,8 +1,25 @@
 from formwizard.tests.storagetests import *
 from django.test import TestCase, Client
-from formwizard.storage.cookie import CookieStorage
+from formwizard.storage.cookie import CookieStorage, split_cookie_value
+from formwizard.storage.codecs import BinaryCodec, JSONCodec, CodecError
 from django.core.exceptions import SuspiciousOperation
 from django.http import HttpResponse
+from formwizard.forms import FormWizard
+from formwizard.tests.formtests import Step1, Step2
+import Cookie
+
+class CountingCodec(JSONCodec):
+    encoded = 0
+
+    def encode(self, data):
+        self.encoded += 1
+        return super(CountingCodec, self).encode(data)
+
+class CountingCookieStorage(CookieStorage):
+    codec = CountingCodec()
+
+class CountingCookieWizard(FormWizard):
+    pass
 
 class TestCookieStorage(TestStorage, TestCase):
     def get_storage(self):
@@ -35,4 +52,124 @@ class TestCookieStorage(TestStorage, TestCase):
         storage.cookie_data = {}
         storage.update_response(response)
         self.assertEqual(response.cookies[storage.prefix].value, '')
-        
\ No newline at end of file
+
+    def test_binary_codec(self):
+        codec = BinaryCodec()
+        data = {
+            'step': u'form2',
+            'step_data': {u'form1': {u'form1-name': u'P\xf6ny', 'count': 300,
+                'neg': -2, 'ratio': 0.5, 'flags': [True, False, None]}},
+            'step_files': {},
+            'extra_context': {},
+        }
+        for threshold in (0, 10000):
+            codec.compress_threshold = threshold
+            payload = codec.encode(data)
+            self.assertEqual(payload[:3], threshold and '~1b' or '~1z')
+            self.assertEqual(codec.decode(payload), data)
+
+        self.assertEqual(codec.decode(JSONCodec().encode(data)), data)
+        self.assertRaises(CodecError, codec.decode, '~2b')
+        self.assertRaises(CodecError, codec.decode, '~1bAAAA')
+        self.assertRaises(CodecError, JSONCodec().decode, payload)
+
+    def test_cookie_codec(self):
+        class BinaryCookieStorage(CookieStorage):
+            codec = BinaryCodec()
+
+        request = get_request()
+        storage = BinaryCookieStorage('wizard1', request, None)
+        storage.set_current_step('form1')
+        storage.set_step_data('form1', {'form1-name': 'Pony'})
+        response = HttpResponse()
+        storage.update_response(response)
+
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+        storage = BinaryCookieStorage('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), 'form1')
+        self.assertEqual(storage.get_step_data('form1'), {'form1-name': 'Pony'})
+
+        storage = CookieStorage('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), None)
+
+    def test_split_cookie_value(self):
+        self.assertEqual(split_cookie_value('abcdefg', 3), ['abc', 'def', 'g'])
+        chunks = split_cookie_value('{"a":"b\\c d"}', 8)
+        self.assertEqual(''.join(chunks), '{"a":"b\\c d"}')
+        for chunk in chunks:
+            self.assertTrue(len(Cookie._quote(chunk)) <= 8)
+
+    def test_chunked_cookies(self):
+        class ChunkedCookieStorage(CookieStorage):
+            max_cookie_size = 50
+
+        request = get_request()
+        storage = ChunkedCookieStorage('wizard1', request, None)
+        storage.set_current_step('form1')
+        storage.set_step_data('form1', {'form1-name': 'Pony' * 20})
+        response = HttpResponse()
+        storage.update_response(response)
+
+        num_chunks = int(response.cookies[storage.prefix].value.split(':')[0])
+        self.assertTrue(num_chunks > 1)
+        for name, morsel in response.cookies.items():
+            self.assertTrue(len(morsel.OutputString().split(';')[0]) <= 50 + len(name) + 1)
+            request.COOKIES[name] = morsel.value
+
+        storage = ChunkedCookieStorage('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), 'form1')
+        self.assertEqual(storage.get_step_data('form1'), {'form1-name': 'Pony' * 20})
+
+        # only changed chunks are sent again, stale chunks get deleted
+        storage.set_step_data('form1', {'form1-name': 'Pony' * 10})
+        response = HttpResponse()
+        storage.update_response(response)
+        new_num_chunks = int(response.cookies[storage.prefix].value.split(':')[0])
+        self.assertTrue(new_num_chunks < num_chunks)
+        self.assertFalse(response.cookies.has_key('%s-1' % storage.prefix))
+        self.assertEqual(response.cookies['%s-%d' % (storage.prefix, num_chunks)].value, '')
+
+        # a missing chunk restarts the wizard
+        del request.COOKIES['%s-2' % storage.prefix]
+        storage = ChunkedCookieStorage('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), None)
+
+        request.COOKIES[storage.prefix] = '99:abc'
+        self.assertRaises(SuspiciousOperation, ChunkedCookieStorage,
+            'wizard1', request, None)
+
+    def test_unchanged_cookie(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        response = HttpResponse()
+        storage.update_response(response)
+        self.assertFalse(response.cookies.has_key(storage.prefix))
+
+        storage.set_current_step('form1')
+        storage.update_response(response)
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        storage = self.get_storage()('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), 'form1')
+        storage.set_current_step('form1')
+        response = HttpResponse()
+        storage.update_response(response)
+        self.assertFalse(response.cookies.has_key(storage.prefix))
+
+        # changed, but equal to the data the browser has
+        storage.reset()
+        storage.set_current_step('form1')
+        storage.update_response(response)
+        self.assertFalse(response.cookies.has_key(storage.prefix))
+
+    def test_unchanged_wizard_get(self):
+        testform = CountingCookieWizard(CountingCookieStorage, [('start', Step1), ('step2', Step2)])
+        request = get_request()
+        request.method = 'GET'
+        response, storage = testform(request, testmode=True)
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        storage.codec.encoded = 0
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.codec.encoded, 0)
+        self.assertFalse(response.cookies.has_key(storage.prefix))
@@ -0,0 +1,49 @@
+from formwizard.tests.storagetests import *
+from django.test import TestCase
+from django.http import HttpResponse
+from formwizard.models import WizardInstance, WizardStep
+from formwizard.storage.db import DBStorage
+
+class TestDBStorage(TestVersionedStorage, TestCase):
+    def get_storage(self):
+        return DBStorage
+
+    def test_step_rows(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.update_response(HttpResponse())
+        self.assertEqual(WizardInstance.objects.count(), 0)
+
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.set_step_data('step2', {'step2-name': 'data2'})
+        storage.set_step_data('start', {'start-name': 'data3'})
+        self.assertEqual(WizardStep.objects.filter(
+            instance=storage.instance).count(), 2)
+
+        storage.reset()
+        self.assertEqual(WizardStep.objects.count(), 0)
+
+    def test_empty_step_data(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_step_data('start', {})
+        self.assertEqual(storage.get_step_data('start'), {})
+        response = storage.update_response(HttpResponse())
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        storage = self.get_storage()('wizard1', request, None)
+        self.assertEqual(storage.get_step_data('start'), {})
+        self.assertEqual(storage.get_step_data('step2'), None)
+
+    def test_delete_expired(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage2 = self.get_storage()('wizard2', request, None)
+        storage2.set_step_data('start', {'start-name': 'data1'})
+        WizardInstance.objects.filter(pk=storage.instance.pk).update(
+            expires=datetime(2000, 1, 1))
+
+        self.assertEqual(WizardInstance.objects.delete_expired(), 1)
+        self.assertEqual(list(WizardInstance.objects.all()), [storage2.instance])
+        self.assertEqual(WizardStep.objects.count(), 1)
@@ -3,9 +3,14 @@ from django import http
 from django import forms
 from formwizard.forms import FormWizard, SessionFormWizard, CookieFormWizard
 from django.conf import settings
+from formwizard.storage.base import StorageConflict
 from formwizard.storage.session import SessionStorage
 from django.utils.importlib import import_module
 from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+import shutil
+import tempfile
 
 class DummyRequest(http.HttpRequest):
     def __init__(self, POST=None):
@@ -40,6 +45,75 @@ UserFormSet = forms.models.modelformset_factory(User, form=UserForm, extra=2)
 class TestWizard(FormWizard):
     pass
 
+class FieldsOnlyWizard(FormWizard):
+    store_form_fields_only = True
+
+class ConflictWizard(FormWizard):
+    conflicts = 1
+    done_calls = 0
+
+    def process_step(self, request, storage, form):
+        # another request changes the state while this one is processed
+        if self.conflicts:
+            self.conflicts -= 1
+            other_storage = self.storage_class(self.get_wizard_name(), request)
+            other_storage.set_step_data('other', {'other-name': 'data2'})
+        return super(ConflictWizard, self).process_step(request, storage, form)
+
+    def done(self, request, storage, form_list, **kwargs):
+        self.done_calls += 1
+        return http.HttpResponse()
+
+class UploadStep(forms.Form):
+    upload = forms.FileField()
+
+class DynamicUploadStep(forms.Form):
+    def __init__(self, *args, **kwargs):
+        super(DynamicUploadStep, self).__init__(*args, **kwargs)
+        self.fields['upload'] = forms.FileField()
+
+class DoneWizard(FormWizard):
+    file_storage = None
+
+    def done(self, request, storage, form_list, **kwargs):
+        self.done_data = [form.cleaned_data for form in form_list]
+        self.done_uploads = [form.cleaned_data['upload'].read()
+            for form in form_list if 'upload' in form.cleaned_data]
+        return http.HttpResponse()
+
+class ProcessStepWizard(DoneWizard):
+    def process_step(self, request, storage, form):
+        data = dict(form.data.items())
+        data[form.add_prefix('name')] = u'processed'
+        return data
+
+class InstancesWizard(FormWizard):
+    multiple_instances = True
+    max_instances = 2
+
+class CountingWizard(FormWizard):
+    def __init__(self, *args, **kwargs):
+        super(CountingWizard, self).__init__(*args, **kwargs)
+        self.constructed_forms = []
+        self.cleaned_forms = []
+
+    def get_form(self, request, storage, step=None, *args, **kwargs):
+        self.constructed_forms.append(step)
+        form = super(CountingWizard, self).get_form(
+            request, storage, step, *args, **kwargs)
+        full_clean = form.full_clean
+        def counting_full_clean():
+            self.cleaned_forms.append(form.prefix)
+            full_clean()
+        form.full_clean = counting_full_clean
+        return form
+
+    def done(self, request, storage, form_list, **kwargs):
+        self.get_all_cleaned_data(request, storage)
+        for step in self.get_form_list(request, storage).keys():
+            self.get_cleaned_data_for_step(request, storage, step)
+        return http.HttpResponse()
+
 class FormTests(TestCase):
     def test_form_init(self):
         testform = TestWizard('formwizard.storage.session.SessionStorage', [Step1, Step2])
@@ -90,6 +164,170 @@ class FormTests(TestCase):
         response, storage = testform(request, testmode=True)
         self.assertEquals(testform.get_next_step(request, storage), 'step3')
 
+    def test_storage_conflict(self):
+        testform = ConflictWizard('formwizard.storage.db.DBStorage', [('start', Step1), ('step2', Step2), ('step3', Step3)])
+        request = get_request()
+        response, storage = testform(request, testmode=True)
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        request.POST = {'start-name': 'data1'}
+        request.method = 'POST'
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(storage.get_current_step(), 'step2')
+        self.assertEqual(storage.get_step_data('start'), {'start-name': 'data1'})
+        self.assertEqual(storage.get_step_data('other'), {'other-name': 'data2'})
+
+        testform.conflicts = 2
+        request.POST = {'step2-name': 'data3'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(storage.get_step_data('step2'), None)
+
+    def test_storage_conflict_done(self):
+        testform = ConflictWizard('formwizard.storage.db.DBStorage', [('start', Step1), ('step2', Step2)])
+        request = get_request()
+        response, storage = testform(request, testmode=True)
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+        storage = testform.get_storage(request)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.set_step_data('step2', {'step2-name': 'data2'})
+
+        # another request changes the state before the done view claims it
+        storage = testform.get_storage(request)
+        other_storage = testform.get_storage(request)
+        other_storage.set_step_data('other', {'other-name': 'data3'})
+        self.assertRaises(StorageConflict, testform.render_done, request, storage, None)
+        self.assertEqual(testform.done_calls, 0)
+
+        storage = testform.get_storage(request)
+        response = testform.render_done(request, storage, None)
+        self.assertEqual(testform.done_calls, 1)
+        self.assertEqual(storage.get_step_data('start'), None)
+
+    def test_multiple_instances(self):
+        testform = InstancesWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2)])
+        request = get_request()
+        response, storage1 = testform(request, testmode=True)
+        instance1 = storage1.request_cache['wizard_instance']
+        self.assertTrue('name="form_instance" value="%s"' % instance1 in response.content)
+        response, storage2 = testform(request, testmode=True)
+        instance2 = storage2.request_cache['wizard_instance']
+        self.assertNotEqual(instance1, instance2)
+
+        request.POST = {'start-name': 'data1', 'form_instance': instance1}
+        request.method = 'POST'
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.prefix, storage1.prefix)
+        self.assertEqual(storage.get_current_step(), 'step2')
+        self.assertEqual(storage.get_step_data('start')['start-name'], 'data1')
+        storage = SessionStorage(storage2.prefix, request)
+        self.assertEqual(storage.get_step_data('start'), None)
+        self.assertEqual(request.session['formwizard_InstancesWizard_instances'], [instance1, instance2])
+
+        # a third instance evicts the least recently used one
+        request.POST = {}
+        request.method = 'GET'
+        response, storage3 = testform(request, testmode=True)
+        instance3 = storage3.request_cache['wizard_instance']
+        self.assertEqual(request.session['formwizard_InstancesWizard_instances'], [instance3, instance1])
+        self.assertFalse(request.session.has_key(storage2.prefix))
+        self.assertTrue(request.session.has_key(storage1.prefix))
+
+    def test_form_condition_cache(self):
+        request = get_request()
+        calls = []
+
+        def condition(wizard, request, storage):
+            calls.append(1)
+            return True
+
+        testform = TestWizard('formwizard.storage.session.SessionStorage',
+            [('start', Step1), ('step2', Step2), ('step3', Step3)],
+            condition_list={'step2': condition})
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(len(calls), 1)
+
+        testform.get_template_context(request, storage, None)
+        self.assertEqual(len(calls), 1)
+
+        storage.set_step_data('start', {'start-name': 'data1'})
+        self.assertEqual(testform.get_next_step(request, storage), 'step2')
+        self.assertEqual(len(calls), 2)
+
+    def test_step_graph(self):
+        request = get_request()
+
+        testform = TestWizard('formwizard.storage.session.SessionStorage',
+            [('start', Step1), ('step2', Step2), ('step3', Step3)])
+        response, storage = testform(request, testmode=True)
+        graph = testform.get_step_graph(request, storage)
+
+        self.assertEqual(graph.steps, ['start', 'step2', 'step3'])
+        self.assertEqual(graph.index('step3'), 2)
+        self.assertEqual(graph.next('step2'), 'step3')
+        self.assertEqual(graph.next('step3'), None)
+        self.assertEqual(graph.prev('start'), None)
+        self.assertEqual(graph.prev('step3'), 'step2')
+        self.assertRaises(ValueError, graph.index, 'step4')
+
+    def test_form_steps(self):
+        testform = TestWizard('formwizard.storage.session.SessionStorage',
+            [('start', Step1), ('user', UserForm), ('users', UserFormSet),
+            ('names', forms.formsets.formset_factory(Step1))])
+        self.assertEqual([(form_step.kind, form_step.instance_kwarg)
+            for form_step in [testform.get_form_step(step)
+                for step in testform.form_list.keys()]],
+            [('form', None), ('modelform', 'instance'),
+            ('modelformset', 'queryset'), ('formset', None)])
+        self.assertEqual(testform.get_form_step('start').prefix, 'start')
+        self.assertFalse(testform.get_form_step('start').has_file_fields)
+
+        testform.form_list['start'] = Step3
+        self.assertEqual(testform.get_form_step('start').form_class, Step3)
+
+    def test_lazy_template_context(self):
+        request = get_request()
+        calls = []
+
+        def condition(wizard, request, storage):
+            calls.append(1)
+            return True
+
+        testform = TestWizard('formwizard.storage.session.SessionStorage',
+            [('start', Step1), ('step2', Step2), ('step3', Step3)],
+            condition_list={'step3': condition})
+        response, storage = testform(request, testmode=True)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        calls = []
+
+        context = testform.get_template_context(request, storage, None)
+        self.assertEqual(calls, [])
+        self.assertEqual(context['form_step'], 'start')
+        self.assertEqual(context['form_next_step'], 'step2')
+        self.assertEqual(calls, [1])
+        self.assertEqual(dict(context.items()), {
+            'extra_context': {},
+            'form_step': 'start',
+            'form_first_step': 'start',
+            'form_last_step': 'step3',
+            'form_prev_step': None,
+            'form_next_step': 'step2',
+            'form_step0': 0,
+            'form_step1': 1,
+            'form_step_count': 3,
+            'form_instance': None,
+            'form': None,
+        })
+        self.assertEqual(calls, [1])
+
+        context = testform.get_template_context(request, storage, None)
+        copied_context = {}
+        copied_context.update(context)
+        for copy in (dict(context), copied_context, dict(**context)):
+            self.assertEqual(copy['form_prev_step'], None)
+            self.assertEqual(copy['form_step_count'], 3)
+
     def test_add_extra_context(self):
         request = get_request()
 
@@ -157,6 +395,58 @@ class FormTests(TestCase):
         testform.render_done(request, storage, None)
         self.assertEqual(storage.get_current_step(), 'start')
 
+    def test_validated_form_cache(self):
+        request = get_request()
+
+        testform = CountingWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2)])
+        response, storage = testform(request, testmode=True)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.set_step_data('step2', {'step2-name': 'data2'})
+
+        testform.constructed_forms = []
+        testform.render_done(request, storage, None)
+        self.assertEqual(testform.constructed_forms, ['start', 'step2'])
+
+    def test_final_submit_validation(self):
+        request = get_request()
+        testform = CountingWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2)])
+        response, storage = testform(request, testmode=True)
+
+        request.POST = {'start-name': 'data1'}
+        request.method = 'POST'
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step2')
+
+        testform.cleaned_forms = []
+        request.POST = {'step2-name': 'data2'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(testform.cleaned_forms, ['step2', 'start'])
+
+    def test_store_form_fields_only(self):
+        post_data = {'start-name': 'data1', 'startx': '1',
+            'csrfmiddlewaretoken': 'token', 'submit': 'Next'}
+        request = get_request(post_data)
+        testform = TestWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', UserFormSet)])
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_step_data('start'), post_data)
+
+        request = get_request(post_data)
+        testform = FieldsOnlyWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', forms.formsets.formset_factory(Step1)), ('step3', Step3)])
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(dict(storage.get_step_data('start').lists()),
+            {'start-name': ['data1']})
+        self.assertEqual(testform.get_cleaned_data_for_step(request, storage,
+            'start'), {'name': 'data1'})
+
+        request = get_request({'step2-TOTAL_FORMS': '1',
+            'step2-INITIAL_FORMS': '0', 'step2-0-name': 'test',
+            'csrfmiddlewaretoken': 'token'})
+        request.session = storage.request.session
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(sorted(storage.get_step_data('step2').keys()),
+            ['step2-0-name', 'step2-INITIAL_FORMS', 'step2-TOTAL_FORMS'])
+
     def test_form_refresh(self):
         testform = TestWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', UserFormSet)])
 
@@ -169,6 +459,98 @@ class FormTests(TestCase):
         response, storage = testform(request, testmode=True)
         self.assertEqual(storage.get_current_step(), 'step2')
 
+    def test_form_current_step(self):
+        testform = TestWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2), ('step3', Step3)])
+
+        request = get_request({'start-name': 'foo'})
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step2')
+
+        # resubmitted first step
+        request.POST = {'form_current_step': 'start', 'start-name': 'bar'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step2')
+        self.assertEqual(storage.get_step_data('start'), request.POST)
+        self.assertEqual(storage.get_step_data('step2'), None)
+
+        # a step which wasn't reached yet
+        request.POST = {'form_current_step': 'step3', 'step3-data': 'foo'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step2')
+        self.assertEqual(storage.get_step_data('step3'), None)
+
+        request.POST = {'form_current_step': 'unknown', 'step2-name': 'foo'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step3')
+
+    def test_template_cache(self):
+        request = get_request()
+        testform = TestWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2)])
+        old_debug = settings.DEBUG
+        try:
+            settings.DEBUG = True
+            response, storage = testform(request, testmode=True)
+            self.assertEqual(testform.template_cache, {})
+
+            settings.DEBUG = False
+            response, storage = testform(request, testmode=True)
+            template = testform.template_cache[('formwizard/wizard.html',)]
+            self.assertTrue(testform.get_compiled_template(request, storage) is template)
+            self.assertTrue('name="form_current_step"' in response.content)
+        finally:
+            settings.DEBUG = old_debug
+
+class DoneFormTests(TestCase):
+    def setUp(self):
+        self.file_storage_location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.file_storage_location)
+
+    def test_done_upload(self):
+        testform = DoneWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', UploadStep)])
+        testform.file_storage = FileSystemStorage(location=self.file_storage_location)
+        request = get_request()
+        response, storage = testform(request, testmode=True)
+        request.POST = {'start-name': 'data1'}
+        request.method = 'POST'
+        response, storage = testform(request, testmode=True)
+
+        uploaded_file = TemporaryUploadedFile('test.txt', 'text/plain', 7, None)
+        uploaded_file.write('content')
+        uploaded_file.seek(0)
+        request.POST = {'form_current_step': 'step2'}
+        request.FILES = {'step2-upload': uploaded_file}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(testform.done_uploads, ['content'])
+
+    def test_done_dynamic_upload(self):
+        testform = DoneWizard('formwizard.storage.session.SessionStorage', [('start', DynamicUploadStep), ('step2', Step2)])
+        testform.file_storage = FileSystemStorage(location=self.file_storage_location)
+        uploaded_file = TemporaryUploadedFile('test.txt', 'text/plain', 7, None)
+        uploaded_file.write('content')
+        uploaded_file.seek(0)
+        request = get_request({'form_current_step': 'start'})
+        request.FILES = {'start-upload': uploaded_file}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(storage.get_current_step(), 'step2')
+
+        request.POST = {'step2-name': 'data2'}
+        request.FILES = {}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(testform.done_uploads, ['content'])
+
+    def test_done_processed_data(self):
+        testform = ProcessStepWizard('formwizard.storage.session.SessionStorage', [('start', Step1), ('step2', Step2)])
+        request = get_request()
+        response, storage = testform(request, testmode=True)
+        request.POST = {'start-name': 'data1'}
+        request.method = 'POST'
+        response, storage = testform(request, testmode=True)
+        request.POST = {'step2-name': 'data2'}
+        response, storage = testform(request, testmode=True)
+        self.assertEqual(testform.done_data, [{'name': u'processed'}, {'name': u'processed'}])
+
 class SessionFormTests(TestCase):
     def test_init(self):
         request = get_request()
@@ -1,7 +1,11 @@
 from django.test import TestCase
-from formwizard.storage import get_storage, MissingStorageModuleException, \
+from formwizard.storage import get_storage, get_storage_class, \
+                               MissingStorageModuleException, \
                                MissingStorageClassException
 from formwizard.storage.base import BaseStorage
+from formwizard.storage.session import SessionStorage
+from formwizard.forms import FormWizard
+from formwizard.tests.formtests import Step1
 
 class TestLoadStorage(TestCase):
     def test_load_storage(self):
@@ -16,3 +20,17 @@ class TestLoadStorage(TestCase):
     def test_missing_class(self):
         self.assertRaises(MissingStorageClassException, get_storage, 
             'formwizard.storage.base.IDontExistStorage', 'wizard1')
+
+    def test_load_storage_class(self):
+        self.assertEqual(
+            get_storage_class('formwizard.storage.session.SessionStorage'),
+            SessionStorage)
+        self.assertEqual(get_storage_class(SessionStorage), SessionStorage)
+        self.assertEqual(type(get_storage(BaseStorage, 'wizard1')), BaseStorage)
+
+    def test_wizard_storage(self):
+        wizard = FormWizard(SessionStorage, [Step1])
+        self.assertEqual(wizard.storage_class, SessionStorage)
+
+        self.assertRaises(MissingStorageClassException, FormWizard,
+            'formwizard.storage.base.IDontExistStorage', [Step1])
@@ -20,10 +20,19 @@ class Page3(forms.Form):
 Page4 = formset_factory(Page3, extra=2)
 
 class ContactWizard(NamedUrlFormWizard):
+    def __init__(self, *args, **kwargs):
+        super(ContactWizard, self).__init__(*args, **kwargs)
+        self.constructed_forms = []
+
+    def get_form(self, request, storage, step=None, *args, **kwargs):
+        self.constructed_forms.append(step or self.determine_step(request, storage))
+        return super(ContactWizard, self).get_form(
+            request, storage, step, *args, **kwargs)
+
     def done(self, request, storage, form_list, **kwargs):
         c = Context({'form_list': [x.cleaned_data for x in form_list], 'all_cleaned_data': self.get_all_cleaned_data(request, storage)})
         for form in self.form_list.keys():
             c[form] = self.get_cleaned_data_for_step(request, storage, form)
 
         c['this_will_fail'] = self.get_cleaned_data_for_step(request, storage, 'this_will_fail')
-        return HttpResponse(Template('').render(c))
\ No newline at end of file
+        return HttpResponse(Template('').render(c))
@@ -1,6 +1,7 @@
 import re
+from urlparse import urlparse
 from django.test import TestCase, Client
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import reverse, resolve, clear_url_caches
 from django.contrib.auth.models import User
 
 from formwizard.forms import NamedUrlSessionFormWizard, NamedUrlCookieFormWizard
@@ -123,6 +124,20 @@ class NamedWizardTests(object):
 
         self.assertEqual(response.context['form_list'], [{'name': u'Pony', 'thirsty': True, 'user': self.testuser}, {'address1': u'123 Main St', 'address2': u'Djangoland'}, {'random_crap': u'blah blah'}, [{'random_crap': u'blah blah'}, {'random_crap': u'blah blah'}]])
 
+    def test_done_form_constructions(self):
+        response = self.client.get(reverse(self.wizard_urlname, kwargs={'step': 'form1'}))
+        for data in self.wizard_step_data[:3]:
+            response = self.client.post(reverse(self.wizard_urlname, kwargs={'step': response.context['form_step']}), data)
+            response = self.client.get(response['Location'])
+
+        response = self.client.post(reverse(self.wizard_urlname, kwargs={'step': 'form4'}), self.wizard_step_data[3])
+        wizard = resolve(urlparse(response['Location'])[2])[0]
+        wizard.constructed_forms = []
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(wizard.constructed_forms),
+            ['form1', 'form2', 'form3', 'form4'])
+
     def test_cleaned_data(self):
         response = self.client.get(reverse(self.wizard_urlname, kwargs={'step': 'form1'}))
         self.assertEqual(response.status_code, 200)
@@ -160,6 +175,14 @@ class NamedWizardTests(object):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context.get('form_step', None), 'form1')
 
+    def test_step_urls(self):
+        response = self.client.get(reverse(self.wizard_urlname, kwargs={'step': 'form1'}))
+        self.assertEqual(response.context['form_step_urls'], dict([
+            (step, reverse(self.wizard_urlname, kwargs={'step': step}))
+            for step in ('form1', 'form2', 'form3', 'form4')]))
+        self.assertEqual(response.context['form_done_url'],
+            reverse(self.wizard_urlname, kwargs={'step': '%s_done' % self.wizard_urlname}))
+
     def test_form_reset(self):
         response = self.client.post(reverse(self.wizard_urlname, kwargs={'step':'form1'}), self.wizard_step_data[0])
         response = self.client.get(response['Location'])
@@ -178,6 +201,47 @@ class NamedSessionWizardTests(NamedWizardTests, TestCase):
 class NamedCookieWizardTests(NamedWizardTests, TestCase):
     wizard_urlname = 'nwiz_cookie'
 
+class NamedRedirectFreeWizardTests(TestCase):
+    urls = 'formwizard.tests.namedwizardtests.urls'
+    wizard_urlname = 'nwiz_redirect_free'
+    wizard_step_data = NamedWizardTests.wizard_step_data
+
+    def setUp(self):
+        self.client = Client()
+        self.testuser, created = User.objects.get_or_create(username='testuser1')
+        self.wizard_step_data[0]['form1-user'] = self.testuser.pk
+
+    def test_initial_call(self):
+        response = self.client.get(reverse('%s_start' % self.wizard_urlname))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form_step'], 'form1')
+        self.assertEqual(response['Content-Location'],
+            reverse(self.wizard_urlname, kwargs={'step': 'form1'}))
+
+    def test_form_finish(self):
+        url = reverse('%s_start' % self.wizard_urlname)
+        for step, data in zip(['form2', 'form3', 'form4'], self.wizard_step_data):
+            response = self.client.post(url, data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['form_step'], step)
+            url = response['Content-Location']
+            self.assertEqual(url, reverse(self.wizard_urlname, kwargs={'step': step}))
+
+        response = self.client.post(url, self.wizard_step_data[3])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form_list'], [{'name': u'Pony', 'thirsty': True, 'user': self.testuser}, {'address1': u'123 Main St', 'address2': u'Djangoland'}, {'random_crap': u'blah blah'}, [{'random_crap': u'blah blah'}, {'random_crap': u'blah blah'}]])
+
+    def test_form_stepback(self):
+        response = self.client.post(reverse(self.wizard_urlname, kwargs={'step': 'form1'}), self.wizard_step_data[0])
+        self.assertEqual(response.context['form_step'], 'form2')
+
+        response = self.client.post(response['Content-Location'], {'form_prev_step': 'form1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form_step'], 'form1')
+        self.assertEqual(response.context['form'].data['form1-name'], u'Pony')
+        self.assertEqual(response['Content-Location'],
+            reverse(self.wizard_urlname, kwargs={'step': 'form1'}))
+
 class NamedFormTests(object):
     urls = 'formwizard.tests.namedwizardtests.urls'
 
@@ -194,6 +258,20 @@ class NamedFormTests(object):
         response, storage = testform(request, extra_context={'key2': 'value2'}, testmode=True)
         self.assertEqual(testform.get_extra_context(request, storage), {'key2': 'value2'})
 
+    def test_step_url_cache(self):
+        request = get_request()
+
+        testform = self.formwizard_class([('start', Step1), ('step2', Step2)], url_name=self.wizard_urlname)
+        response, storage = testform(request, step='start', testmode=True)
+        step_urls = testform.get_step_urls(request, storage)
+        self.assertEqual(step_urls['step2'],
+            reverse(self.wizard_urlname, kwargs={'step': 'step2'}))
+        self.assertTrue(testform.get_step_urls(request, storage) is step_urls)
+
+        clear_url_caches()
+        self.assertFalse(testform.get_step_urls(request, storage) is step_urls)
+        self.assertEqual(testform.get_step_urls(request, storage), step_urls)
+
     def test_revalidation(self):
         request = get_request()
 
@@ -17,9 +17,20 @@ def get_named_cookie_wizard():
         done_step_name='nwiz_cookie_done'
     )
 
+def get_named_redirect_free_wizard():
+    return ContactWizard(
+        'formwizard.storage.session.SessionStorage',
+        [('form1', Page1), ('form2', Page2), ('form3', Page3), ('form4', Page4)],
+        url_name='nwiz_redirect_free',
+        done_step_name='nwiz_redirect_free_done',
+        redirect_free=True
+    )
+
 urlpatterns = patterns('',
     url(r'^nwiz_session/(?P<step>.+)/$', get_named_session_wizard(), name='nwiz_session'),
     url(r'^nwiz_session/$', get_named_session_wizard(), name='nwiz_session_start'),
     url(r'^nwiz_cookie/(?P<step>.+)/$', get_named_cookie_wizard(), name='nwiz_cookie'),
     url(r'^nwiz_cookie/$', get_named_cookie_wizard(), name='nwiz_cookie_start'),
+    url(r'^nwiz_redirect_free/(?P<step>.+)/$', get_named_redirect_free_wizard(), name='nwiz_redirect_free'),
+    url(r'^nwiz_redirect_free/$', get_named_redirect_free_wizard(), name='nwiz_redirect_free_start'),
 )
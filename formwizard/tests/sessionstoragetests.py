@@ -5,3 +5,42 @@ from formwizard.storage.session import SessionStorage
 class TestSessionStorage(TestStorage, TestCase):
     def get_storage(self):
         return SessionStorage
+
+    def test_unchanged_session(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_current_step('start')
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.update_response(None)
+        self.assertTrue(request.session.modified)
+
+        request.session.modified = False
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_current_step('start')
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.update_response(None)
+        self.assertFalse(request.session.modified)
+
+        storage.set_step_data('start', {'start-name': 'data2'})
+        storage.update_response(None)
+        self.assertTrue(request.session.modified)
+
+class SeparateKeysSessionStorage(SessionStorage):
+    separate_step_keys = True
+
+class TestSeparateKeysSessionStorage(TestStorage, TestCase):
+    def get_storage(self):
+        return SeparateKeysSessionStorage
+
+    def test_step_keys(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_step_data('start', {'start-name': 'data1'})
+
+        self.assertEqual(request.session['formwizard_wizard1-start'],
+            {'start-name': 'data1'})
+        self.assertEqual(storage.get_step_data('start'), {'start-name': 'data1'})
+
+        storage.reset()
+        self.assertFalse(request.session.has_key('formwizard_wizard1-start'))
+        self.assertEqual(storage.get_step_data('start'), None)
@@ -1,8 +1,14 @@
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponse
 from django.conf import settings
 from django.utils.importlib import import_module
 from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from formwizard.models import TemporaryUpload
+from formwizard.storage.base import StorageConflict
 from datetime import datetime
+import shutil
+import tempfile
 
 def get_request():
     request = HttpRequest()
@@ -13,6 +19,10 @@ def get_request():
 class TestStorage(object):
     def setUp(self):
         self.testuser, created = User.objects.get_or_create(username='testuser1')
+        self.file_storage_location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.file_storage_location)
 
     def test_current_step(self):
         request = get_request()
@@ -49,6 +59,25 @@ class TestStorage(object):
         storage2 = self.get_storage()('wizard2', request, None)
         self.assertEqual(storage2.get_step_data(step1), None)
 
+    def test_steps_data(self):
+        request = get_request()
+        file_storage = FileSystemStorage(location=self.file_storage_location)
+        storage = self.get_storage()('wizard1', request, file_storage)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        storage.set_step_data('step2', {'step2-name': 'data2'})
+        storage.set_step_files('step2', {
+            'file1': SimpleUploadedFile('test.txt', 'content', 'text/plain')})
+
+        self.assertEqual(storage.get_steps_data(['start', 'step2', 'step3']), {
+            'start': {'start-name': 'data1'},
+            'step2': {'step2-name': 'data2'},
+            'step3': None,
+        })
+        steps_files = storage.get_steps_files(['start', 'step2'])
+        self.assertEqual(steps_files['start'], None)
+        self.assertEqual(steps_files['step2']['file1'].read(), 'content')
+        storage.reset()
+
     def test_extra_context(self):
         request = get_request()
         storage = self.get_storage()('wizard1', request, None)
@@ -65,3 +94,137 @@ class TestStorage(object):
         storage.set_extra_context_data(extra_context)
         storage2 = self.get_storage()('wizard2', request, None)
         self.assertEqual(storage2.get_extra_context_data(), {})
+
+    def test_step_files(self):
+        request = get_request()
+        file_storage = FileSystemStorage(location=self.file_storage_location)
+        storage = self.get_storage()('wizard1', request, file_storage)
+
+        storage.set_step_files('start', {
+            'file1': SimpleUploadedFile('test.txt', 'content', 'text/plain')})
+        step_files = storage.get_step_files('start')
+        self.assertEqual(step_files['file1'].name, 'test.txt')
+        self.assertEqual(step_files['file1'].size, 7)
+        self.assertEqual(step_files['file1'].content_type, 'text/plain')
+        self.assertTrue(step_files['file1'].closed)
+
+        self.assertEqual(step_files['file1'].read(), 'content')
+        self.assertFalse(step_files['file1'].closed)
+
+        storage.close_files()
+        self.assertTrue(step_files['file1'].closed)
+        self.assertEqual(step_files['file1'].read(), 'content')
+        storage.close_files()
+
+    def test_reset_files(self):
+        request = get_request()
+        file_storage = FileSystemStorage(location=self.file_storage_location)
+        storage = self.get_storage()('wizard1', request, file_storage)
+
+        storage.set_step_files('start', {
+            'file1': SimpleUploadedFile('test.txt', 'content')})
+        storage.set_step_files('step2', {
+            'file1': SimpleUploadedFile('test2.txt', 'content2')})
+        storage.set_step_files('step3', {
+            'file1': SimpleUploadedFile('test3.txt', 'content3')})
+        opened_file = storage.get_step_files('start')['file1']
+        unopened_file = storage.get_step_files('step2')['file1']
+        opened_file.read(1)
+
+        storage.reset()
+        self.assertTrue(unopened_file.closed)
+        self.assertEqual(opened_file.read(), 'ontent')
+        self.assertEqual(len(file_storage.listdir('')[1]), 3)
+
+        storage.close_files()
+        self.assertTrue(opened_file.closed)
+        # files handed out during the request stay until the cleanup
+        self.assertEqual(sorted(file_storage.listdir('')[1]),
+            sorted([opened_file.tmp_name, unopened_file.tmp_name]))
+        self.assertEqual(unopened_file.read(), 'content2')
+        unopened_file.close()
+        self.assertEqual(
+            TemporaryUpload.objects.delete_expired(file_storage), 2)
+        self.assertEqual(file_storage.listdir('')[1], [])
+
+    def test_step_files_deduplication(self):
+        request = get_request()
+        file_storage = FileSystemStorage(location=self.file_storage_location)
+        storage = self.get_storage()('wizard1', request, file_storage)
+        storage2 = self.get_storage()('wizard2', request, file_storage)
+
+        storage.set_step_files('start', {
+            'file1': SimpleUploadedFile('test.txt', 'content')})
+        storage.set_step_files('step2', {
+            'file1': SimpleUploadedFile('other.txt', 'content')})
+        storage2.set_step_files('start', {
+            'file1': SimpleUploadedFile('test.txt', 'content')})
+        tmp_name = storage.get_step_files('start')['file1'].tmp_name
+        self.assertEqual(storage.get_step_files('step2')['file1'].tmp_name, tmp_name)
+        self.assertEqual(storage2.get_step_files('start')['file1'].tmp_name, tmp_name)
+        self.assertEqual(storage.get_step_files('step2')['file1'].name, 'other.txt')
+        self.assertEqual(file_storage.listdir('')[1], [tmp_name])
+        storage.close_files()
+        storage2.close_files()
+
+        storage.set_step_files('start', {
+            'file1': SimpleUploadedFile('test.txt', 'new content')})
+        storage.reset()
+        storage.close_files()
+        self.assertTrue(file_storage.exists(tmp_name))
+
+        storage2.reset()
+        self.assertTrue(file_storage.exists(tmp_name))
+        storage2.close_files()
+        self.assertFalse(file_storage.exists(tmp_name))
+        self.assertEqual(file_storage.listdir('')[1], [])
+
+class TestVersionedStorage(TestStorage):
+    """
+    Tests of storages which keep the wizard key in a cookie and a version of
+    the state.
+    """
+    def test_wizard_key(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        response = storage.update_response(HttpResponse())
+        self.assertFalse(response.cookies.has_key(storage.prefix))
+
+        storage.set_current_step('start')
+        storage.set_step_data('start', {'start-name': 'data1'})
+        response = storage.update_response(HttpResponse())
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+
+        storage = self.get_storage()('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), 'start')
+        self.assertEqual(storage.get_step_data('start'), {'start-name': 'data1'})
+        self.assertEqual(storage.get_step_data('step2'), None)
+        response = storage.update_response(HttpResponse())
+        self.assertFalse(response.cookies.has_key(storage.prefix))
+
+        request.COOKIES[storage.prefix] = 'unknown'
+        storage = self.get_storage()('wizard1', request, None)
+        self.assertEqual(storage.get_current_step(), None)
+
+    def test_conflict(self):
+        request = get_request()
+        storage = self.get_storage()('wizard1', request, None)
+        storage.set_step_data('start', {'start-name': 'data1'})
+        response = storage.update_response(HttpResponse())
+        request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+        version = storage.get_version()
+
+        storage1 = self.get_storage()('wizard1', request, None)
+        storage2 = self.get_storage()('wizard1', request, None)
+        storage1.set_step_data('step2', {'step2-name': 'data2'})
+        storage1.set_current_step('step3')
+        self.assertEqual(storage1.get_version(), version + 1)
+        self.assertRaises(StorageConflict, storage2.set_step_data,
+            'step2', {'step2-name': 'data3'})
+        self.assertRaises(StorageConflict, storage2.reset)
+
+        storage3 = self.get_storage()('wizard1', request, None)
+        self.assertEqual(storage3.get_version(), version + 1)
+        self.assertEqual(storage3.get_step_data('step2'), {'step2-name': 'data2'})
+        storage3.set_current_step('step2')
+        self.assertEqual(storage3.get_version(), version + 2)
@@ -0,0 +1,199 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile, \
+                                            TemporaryUploadedFile
+from django.utils.hashcompat import sha_constructor
+from formwizard.models import TemporaryUpload
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import time
+
+# The location is set by `TestTemporaryUpload.setUp`.
+cleanup_storage = FileSystemStorage()
+
+class ReadStorage(FileSystemStorage):
+    """
+    Saves files using `read` like most remote storages instead of `chunks`.
+    """
+    def _save(self, name, content):
+        return super(ReadStorage, self)._save(name,
+            ContentFile(content.read()))
+
+class UnreadStorage(FileSystemStorage):
+    """
+    Saves files without reading them through the passed file.
+    """
+    def _save(self, name, content):
+        content.file.seek(0)
+        return super(UnreadStorage, self)._save(name,
+            ContentFile(content.file.read()))
+
+class TestTemporaryUpload(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.file_storage = FileSystemStorage(
+            location=os.path.join(self.location, 'storage'))
+        cleanup_storage.location = os.path.join(self.location, 'cleanup')
+        os.mkdir(os.path.join(self.location, 'sources'))
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def create_file(self, content):
+        fd, path = tempfile.mkstemp(dir=os.path.join(self.location, 'sources'))
+        os.write(fd, content)
+        os.close(fd)
+        return path
+
+    def test_store_in_memory(self):
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        self.assertEqual(upload.checksum, sha_constructor('content').hexdigest())
+        self.assertEqual(upload.size, 7)
+        self.assertEqual(self.file_storage.open(upload.tmp_name).read(), 'content')
+
+        upload2 = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test2.txt', 'content'))
+        self.assertEqual(upload2.tmp_name, upload.tmp_name)
+        self.assertEqual(TemporaryUpload.objects.get(pk=upload.pk).references, 2)
+
+    def test_store_temporary_file(self):
+        uploaded_file = TemporaryUploadedFile('test.txt', 'text/plain', 7, None)
+        uploaded_file.write('content')
+        uploaded_file.seek(0)
+        temporary_file_path = uploaded_file.temporary_file_path()
+
+        upload = TemporaryUpload.objects.store(self.file_storage, uploaded_file)
+        self.assertFalse(os.path.exists(temporary_file_path))
+        self.assertEqual(upload.size, 7)
+        self.assertEqual(self.file_storage.open(upload.tmp_name).read(), 'content')
+
+    def test_store_streamed(self):
+        path = self.create_file('content' * 10000)
+
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            File(open(path, 'rb'), 'test.txt'))
+        self.assertEqual(upload.checksum,
+            sha_constructor('content' * 10000).hexdigest())
+        self.assertEqual(upload.size, 70000)
+
+        upload2 = TemporaryUpload.objects.store(self.file_storage,
+            File(open(path, 'rb'), 'test.txt'))
+        self.assertEqual(upload2.tmp_name, upload.tmp_name)
+        self.assertEqual(self.file_storage.listdir('')[1], [upload.tmp_name])
+
+    def test_store_in_memory_read(self):
+        file_storage = ReadStorage(location=self.file_storage.location)
+        upload = TemporaryUpload.objects.store(file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        self.assertEqual(file_storage.open(upload.tmp_name).read(), 'content')
+
+    def test_store_released(self):
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        # another request released the upload after it was looked up
+        TemporaryUpload.objects.release(self.file_storage, upload.tmp_name)
+        self.assertEqual(TemporaryUpload.objects._add_reference(
+            upload.location, upload.checksum), None)
+
+        upload2 = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        self.assertEqual(self.file_storage.open(upload2.tmp_name).read(),
+            'content')
+        self.assertEqual(upload2.references, 1)
+
+    def test_store_streamed_read(self):
+        file_storage = ReadStorage(location=self.file_storage.location)
+        paths = [self.create_file(content)
+            for content in ('alice secret', 'bob secret', 'alice secret')]
+
+        uploads = [TemporaryUpload.objects.store(file_storage,
+            File(open(path, 'rb'), 'test.txt')) for path in paths]
+        self.assertEqual(uploads[0].checksum,
+            sha_constructor('alice secret').hexdigest())
+        self.assertEqual(file_storage.open(uploads[1].tmp_name).read(),
+            'bob secret')
+        self.assertNotEqual(uploads[1].tmp_name, uploads[0].tmp_name)
+        self.assertEqual(uploads[2].tmp_name, uploads[0].tmp_name)
+
+    def test_store_streamed_unread(self):
+        file_storage = UnreadStorage(location=self.file_storage.location)
+        paths = [self.create_file(content)
+            for content in ('alice secret', 'bob secret')]
+
+        uploads = [TemporaryUpload.objects.store(file_storage,
+            File(open(path, 'rb'), 'test.txt')) for path in paths]
+        self.assertNotEqual(uploads[1].tmp_name, uploads[0].tmp_name)
+        self.assertEqual(file_storage.open(uploads[1].tmp_name).read(),
+            'bob secret')
+        self.assertEqual(uploads[1].size, 10)
+
+    def test_release(self):
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+
+        TemporaryUpload.objects.release(self.file_storage, upload.tmp_name)
+        self.assertTrue(self.file_storage.exists(upload.tmp_name))
+
+        TemporaryUpload.objects.release(self.file_storage, upload.tmp_name)
+        self.assertFalse(self.file_storage.exists(upload.tmp_name))
+        self.assertEqual(TemporaryUpload.objects.count(), 0)
+
+    def test_delete_expired(self):
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        upload2 = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content2'))
+        TemporaryUpload.objects.filter(pk=upload.pk).update(
+            expires=datetime(2000, 1, 1))
+
+        self.assertEqual(
+            TemporaryUpload.objects.delete_expired(self.file_storage), 1)
+        self.assertFalse(self.file_storage.exists(upload.tmp_name))
+        self.assertTrue(self.file_storage.exists(upload2.tmp_name))
+        self.assertEqual(list(TemporaryUpload.objects.all()), [upload2])
+
+    def test_delete_orphans(self):
+        upload = TemporaryUpload.objects.store(self.file_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        orphan = self.file_storage.save('sub/orphan.txt',
+            SimpleUploadedFile('orphan.txt', 'orphan'))
+        new_orphan = self.file_storage.save('new_orphan.txt',
+            SimpleUploadedFile('new_orphan.txt', 'new orphan'))
+        old = time.time() - 365 * 24 * 3600
+        for name in (upload.tmp_name, orphan):
+            os.utime(self.file_storage.path(name), (old, old))
+
+        self.assertEqual(
+            TemporaryUpload.objects.delete_orphans(self.file_storage, '.'), 1)
+        self.assertTrue(self.file_storage.exists(upload.tmp_name))
+        self.assertFalse(self.file_storage.exists(orphan))
+        self.assertTrue(self.file_storage.exists(new_orphan))
+
+    def test_cleanup_command(self):
+        upload = TemporaryUpload.objects.store(cleanup_storage,
+            SimpleUploadedFile('test.txt', 'content'))
+        TemporaryUpload.objects.filter(pk=upload.pk).update(
+            expires=datetime(2000, 1, 1))
+
+        orphan = cleanup_storage.save('orphan.txt',
+            SimpleUploadedFile('orphan.txt', 'orphan'))
+        old = time.time() - 365 * 24 * 3600
+        os.utime(cleanup_storage.path(orphan), (old, old))
+
+        call_command('formwizard_cleanup',
+            'formwizard.tests.uploadtests.cleanup_storage', verbosity=0)
+        self.assertFalse(cleanup_storage.exists(upload.tmp_name))
+        self.assertEqual(TemporaryUpload.objects.count(), 0)
+        self.assertTrue(cleanup_storage.exists(orphan))
+
+        call_command('formwizard_cleanup',
+            'formwizard.tests.uploadtests.cleanup_storage', orphans='.',
+            verbosity=0)
+        self.assertFalse(cleanup_storage.exists(orphan))
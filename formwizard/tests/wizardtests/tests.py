@@ -160,3 +160,9 @@ class SessionWizardTests(WizardTests, TestCase):
 
 class CookieWizardTests(WizardTests, TestCase):
     wizard_url = '/wiz_cookie/'
+
+class CacheWizardTests(WizardTests, TestCase):
+    wizard_url = '/wiz_cache/'
+
+class DBWizardTests(WizardTests, TestCase):
+    wizard_url = '/wiz_db/'
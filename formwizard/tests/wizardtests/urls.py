@@ -4,4 +4,6 @@ from formwizard.tests.wizardtests.forms import ContactWizard, Page1, Page2, Page
 urlpatterns = patterns('',
     url(r'^wiz_session/$', ContactWizard('formwizard.storage.session.SessionStorage', [('form1', Page1), ('form2', Page2), ('form3', Page3), ('form4', Page4)])),
     url(r'^wiz_cookie/$', ContactWizard('formwizard.storage.cookie.CookieStorage', [('form1', Page1), ('form2', Page2), ('form3', Page3), ('form4', Page4)])),
+    url(r'^wiz_cache/$', ContactWizard('formwizard.storage.cache.CacheStorage', [('form1', Page1), ('form2', Page2), ('form3', Page3), ('form4', Page4)])),
+    url(r'^wiz_db/$', ContactWizard('formwizard.storage.db.DBStorage', [('form1', Page1), ('form2', Page2), ('form3', Page3), ('form4', Page4)])),
     )